@@ -1,12 +1,75 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
+import cProfile
 import json
+import os
+import time
 from copy import deepcopy
-from game_engine import TicTacToeGame, Agent
+from game_engine import TicTacToeGame, Agent, PLAYER_O, OPPONENTS, analyze_boards
+from game_tree import GameTree, TreeSession
+from nk_game import NKGame
+from tree_jobs import TreeJobs
+from metrics import GAMES_CREATED, GAME_CREATION, Gauge, Histogram, render
+from sessions import MemorySessionStore, create_store, new_game_id, new_session
+
+try:
+    import msgpack  # Optional: enables format='msgpack' for tree requests
+except ImportError:
+    msgpack = None
 
 app = Flask(__name__)
 
-games = {}
-last_decision_context = {}  # Store the decision context for tree visualization
+# Compact per-game state (board, moves, decision context) with LRU/TTL
+# eviction; set SESSION_BACKEND=sqlite to share games between workers
+sessions = create_store()
+# Each game's place in the tree between requests, so a new move only sends
+# what changed. Kept per process: a worker without it starts the client over
+trees = MemorySessionStore(sessions.max_sessions, sessions.ttl)
+# Every 3x3 game reads the same trained values, so they share one tree; it
+# grows to at most every reachable position and is never pruned
+shared_tree = GameTree(TicTacToeGame())
+# Deep trees are built in worker processes (TREE_WORKERS, default 2)
+tree_jobs = TreeJobs()
+
+MAX_TREE_DEPTH = 4  # Deepest slice a single tree request may ask for
+TREE_FORMATS = ('nested', 'compact', 'msgpack', 'delta')
+MAX_JOB_DEPTH = 9   # Background jobs may build whole trees
+MAX_BOARD_SIZE = 7  # Largest N for N x N variants
+VARIANT_OPPONENTS = ('search',)  # Boards other than 3x3 play against alpha-beta search
+MAX_BATCH_MOVES = 1000  # Moves one /make_moves request may carry
+
+REQUEST_LATENCY = Histogram('tictactoe_http_request_seconds', 'Request handling time by endpoint and status',
+                            ['endpoint', 'status'])
+Gauge('tictactoe_sessions', 'Live game sessions', lambda: len(sessions))
+Gauge('tictactoe_tree_sessions', 'Game trees kept between requests in this process', lambda: len(trees))
+
+# With PROFILE_DIR set, a request with ?profile=1 runs under cProfile and
+# its stats are written there (open them with pstats or snakeviz)
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    if PROFILE_DIR and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request(response):
+    # Streamed bodies are generated after this, so only their setup counts
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f'{request.endpoint}-{time.time():.6f}.prof')
+        profiler.dump_stats(path)
+        response.headers['X-Profile'] = os.path.basename(path)
+    REQUEST_LATENCY.labels(request.endpoint or 'unknown', response.status_code).observe(
+        time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -18,15 +81,32 @@ def td_visualization():
 
 @app.route('/new_game', methods=['POST'])
 def new_game():
-    game = TicTacToeGame()
-    game_id = id(game)
-    games[game_id] = game
+    data = request.get_json(silent=True) or {}
+    size = data.get('size', 3)
+    if not isinstance(size, int) or not 3 <= size <= MAX_BOARD_SIZE:
+        return jsonify({'error': 'Invalid size'}), 400
+    k = data.get('k', 3 if size == 3 else 4)
+    if not isinstance(k, int) or not 3 <= k <= size:
+        return jsonify({'error': 'Invalid k'}), 400
+    variant = (size, k) != (3, 3)
+    opponent = data.get('opponent', 'search' if variant else 'trained')
+    if opponent not in (VARIANT_OPPONENTS if variant else OPPONENTS):
+        return jsonify({'error': 'Unknown opponent'}), 400
+    
+    with GAME_CREATION.time():
+        session = new_session(opponent, size, k)
+        game_id = new_game_id()
+        sessions.put(game_id, session)
+    GAMES_CREATED.labels(opponent).inc()
     
     return jsonify({
-        'board': game.board,
+        'board': session['board'],
         'status': 'active',
         'current_player': 'human',
-        'game_id': game_id
+        'game_id': game_id,
+        'opponent': opponent,
+        'size': size,
+        'k': k
     })
 
 @app.route('/make_move', methods=['POST'])
@@ -36,78 +116,345 @@ def make_move():
     col = data['col']
     game_id = data.get('game_id')
     
-    if game_id not in games:
+    game, session = load_game(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 400
     
-    game = games[game_id]
-    
     if not game.is_valid_move(row, col):
         return jsonify({'error': 'Invalid move'}), 400
     
+    result = human_move(game, session, row, col)
+    if result is None:
+        result = ai_reply(game, session)
+    sessions.put(game_id, session)
+    return jsonify(result)
+
+@app.route('/make_moves', methods=['POST'])
+def make_moves():
+    """Moves for many games in one request, answered in the order given
+
+    Each move is a [game_id, row, col] triple or an object with those
+    keys. A bad move only fails its own entry. AI replies of trained 3x3
+    games are analysed together, once per distinct board, before any
+    game plays its reply.
+    """
+    data = request.get_json(silent=True) or {}
+    moves = data.get('moves')
+    if not isinstance(moves, list) or len(moves) > MAX_BATCH_MOVES:
+        return jsonify({'error': f'moves must be a list of at most {MAX_BATCH_MOVES} moves'}), 400
+    with_values = bool(data.get('move_values', False))
+
+    results = [None] * len(moves)
+    pending = []  # (position, game_id, game, session) of games waiting for the AI
+    seen = set()
+    for n, move in enumerate(moves):
+        if isinstance(move, dict):
+            move = [move.get('game_id'), move.get('row'), move.get('col')]
+        if not isinstance(move, list) or len(move) != 3:
+            results[n] = {'error': 'Invalid move'}
+            continue
+        game_id, row, col = move
+        if not isinstance(game_id, str):
+            results[n] = {'error': 'Invalid game_id'}
+            continue
+        if game_id in seen:
+            results[n] = {'game_id': game_id, 'error': 'Game already has a move in this batch'}
+            continue
+        game, session = load_game(game_id)
+        if game is None:
+            results[n] = {'game_id': game_id, 'error': 'Game not found'}
+            continue
+        if not is_int(row) or not is_int(col) or not game.is_valid_move(row, col):
+            results[n] = {'game_id': game_id, 'error': 'Invalid move'}
+            continue
+        seen.add(game_id)
+        result = human_move(game, session, row, col)
+        if result is None:
+            pending.append((n, game_id, game, session))
+        else:
+            sessions.put(game_id, session)
+            results[n] = dict(result, game_id=game_id)
+
+    analyze_boards([game.board for _, _, game, _ in pending
+                    if isinstance(game, TicTacToeGame) and game.opponent == 'trained'])
+    for n, game_id, game, session in pending:
+        result = ai_reply(game, session)
+        sessions.put(game_id, session)
+        if not with_values:
+            del result['move_values']
+        results[n] = dict(result, game_id=game_id)
+
+    return jsonify({'results': results})
+
+def human_move(game, session, row, col):
+    """Play a valid human move; the response if it ends the game, else None"""
     game.make_move(row, col, 1)
+    session['moves'].append([row, col, 1])
     winner = game.check_winner()
     
     if winner:
-        return jsonify({
+        return {
             'board': game.board,
             'status': 'finished',
             'winner': 'human' if winner == 1 else 'draw' if winner == 3 else 'ai'
-        })
-    
+        }
+    return None
+
+def ai_reply(game, session):
+    """Play the AI's move after a human move; the response fields"""
     # Get move values BEFORE AI makes its move (for left panel display)
     move_values = game.get_move_values()
     
     # Store the decision context for tree visualization
-    last_decision_context[game_id] = {
+    session['decision'] = {
         'board': deepcopy(game.board),
         'move_values': move_values.copy()
     }
     
     ai_move = game.ai_move()
+    winner = None
     
     # Now make the AI move
     if ai_move:
         game.make_move(ai_move[0], ai_move[1], 2)
+        session['moves'].append([ai_move[0], ai_move[1], 2])
         winner = game.check_winner()
     
-    return jsonify({
+    return {
         'board': game.board,
         'status': 'finished' if winner else 'active',
         'winner': 'ai' if winner == 2 else 'draw' if winner == 3 else None,
         'ai_move': ai_move,
         'move_values': move_values
-    })
+    }
+
+def load_game(game_id):
+    """Rebuild a game from its session; (None, None) if it is unknown or expired"""
+    session = sessions.get(game_id) if isinstance(game_id, str) else None
+    if session is None:
+        return None, None
+    # Games are cheap to rebuild: the value tables are shared
+    size, k = session.get('size', 3), session.get('k', 3)
+    if (size, k) != (3, 3):
+        # Larger variants share one search table per board size
+        game = NKGame(size, k)
+    else:
+        game = TicTacToeGame(session['opponent'])
+    game.board = session['board']
+    return game, session
+
+def tree_root(session):
+    """Board and source the visualization tree for a game starts from"""
+    # Check if we have stored decision context (board state before AI move)
+    if session['decision'] is not None:
+        # Use the board state from when AI was making its decision
+        return session['decision']['board'], 'decision_context'
+    # Fallback to current game state
+    return session['board'], 'current_state'
+
+def is_int(value):
+    """True for JSON integers; bools are ints in Python but not valid here"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def tree_depth(data):
+    """Requested tree depth, clamped so one response stays small"""
+    try:
+        depth = int(data.get('depth', 2))
+    except (TypeError, ValueError):
+        return None
+    return max(0, min(depth, MAX_TREE_DEPTH))
+
+def tree_format(data):
+    """Requested tree encoding, or None if it is unknown or unavailable"""
+    fmt = data.get('format', 'nested')
+    if fmt not in TREE_FORMATS or (fmt == 'msgpack' and msgpack is None):
+        return None
+    return fmt
+
+def records_response(header, records, packed=False):
+    """Tree response made of header fields plus a 'nodes' list of records
+
+    JSON is streamed a record at a time, so large trees never sit in
+    memory as one string; msgpack is packed in one go.
+    """
+    if packed:
+        return Response(msgpack.packb(dict(header, nodes=list(records))),
+                        mimetype='application/msgpack')
+
+    def generate():
+        yield json.dumps(header)[:-1] + ', "nodes": ['
+        for n, record in enumerate(records):
+            yield (',' if n else '') + json.dumps(record, separators=(',', ':'))
+        yield ']}'
+    return Response(generate(), mimetype='application/json')
+
+def tree_session(game_id, token):
+    """This process's tree session for a game; a new one if the client's token is stale"""
+    state = trees.get(game_id)
+    if state is None or state.token != token:
+        state = TreeSession(shared_tree)
+        trees.put(game_id, state)
+    return state
 
 @app.route('/game_tree', methods=['POST'])
 def get_game_tree():
     data = request.get_json()
     game_id = data.get('game_id')
-    depth = data.get('depth', 2)
+    depth = tree_depth(data)
+    
+    fmt = tree_format(data)
     
-    if game_id not in games:
+    game, session = load_game(game_id)
+    if game is None:
         return jsonify({'error': 'Game not found'}), 400
+    if depth is None:
+        return jsonify({'error': 'Invalid depth'}), 400
+    if fmt is None:
+        return jsonify({'error': 'Unsupported format'}), 400
+    if isinstance(game, NKGame):
+        return jsonify({'error': 'Game trees are only available for 3x3 games'}), 400
     
-    # Check if we have stored decision context (board state before AI move)
-    if game_id in last_decision_context:
-        # Use the board state from when AI was making its decision
-        decision_context = last_decision_context[game_id]
-        temp_game = TicTacToeGame()
-        temp_game.board = decision_context['board']
-        temp_game.ai_agent.values = games[game_id].ai_agent.values  # Use same trained values
-        tree = temp_game.generate_game_tree()
-        source = 'decision_context'
-    else:
-        # Fallback to current game state
-        game = games[game_id]
-        tree = game.generate_game_tree()
-        source = 'current_state'
+    board, source = tree_root(session)
+    if fmt == 'delta':
+        # Re-root last turn's tree at the new position and send what is new
+        state = tree_session(game_id, data.get('token'))
+        root, records = state.delta(board, PLAYER_O, depth, reroot=True)
+        return records_response({
+            'current_board': game.board,
+            'source': source,
+            'format': 'delta',
+            'token': state.token,
+            'root': root,
+            'player': PLAYER_O,
+            'start_depth': 0
+        }, records)
+    if fmt != 'nested':
+        return records_response({
+            'current_board': game.board,
+            'source': source,
+            'format': 'compact',
+            'player': PLAYER_O,
+            'start_depth': 0
+        }, GameTree(game).compact_nodes(board, PLAYER_O, depth), fmt == 'msgpack')
+    tree = GameTree(game).to_nested(board, PLAYER_O, depth)
     
     return jsonify({
         'tree': tree,
-        'current_board': games[game_id].board,
+        'current_board': game.board,
         'source': source
     })
 
+@app.route('/game_tree/expand', methods=['POST'])
+def expand_game_tree():
+    """Return the subtree below one node, identified by a path or a board"""
+    data = request.get_json()
+    game_id = data.get('game_id')
+    depth = tree_depth(data)
+    
+    fmt = tree_format(data)
+    
+    game, session = load_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 400
+    if depth is None:
+        return jsonify({'error': 'Invalid depth'}), 400
+    if fmt is None:
+        return jsonify({'error': 'Unsupported format'}), 400
+    if isinstance(game, NKGame):
+        return jsonify({'error': 'Game trees are only available for 3x3 games'}), 400
+    
+    if 'path' in data:
+        # Path of [row, col] moves from the tree root, AI moving first
+        path = data['path']
+        if not isinstance(path, list) or any(
+                not isinstance(move, list) or len(move) != 2 or not all(is_int(n) for n in move)
+                for move in path):
+            return jsonify({'error': 'Invalid path'}), 400
+        board, _ = tree_root(session)
+        board = deepcopy(board)
+        player = 2
+        for row, col in path:
+            if game.check_winner_for_board(board) is not None or not (
+                    0 <= row < 3 and 0 <= col < 3 and board[row][col] == 0):
+                return jsonify({'error': 'Invalid path'}), 400
+            board[row][col] = player
+            player = 3 - player
+        start_depth = len(path)
+    elif 'board' in data:
+        board = data['board']
+        player = data.get('player', 2)
+        if (not isinstance(board, list) or len(board) != 3
+                or any(not isinstance(row, list) or len(row) != 3 for row in board)
+                or any(not is_int(cell) or cell not in (0, 1, 2) for row in board for cell in row)
+                or not is_int(player) or player not in (1, 2)):
+            return jsonify({'error': 'Invalid board'}), 400
+        start_depth = data.get('start_depth', 0)
+        if not is_int(start_depth) or start_depth < 0:
+            return jsonify({'error': 'Invalid start_depth'}), 400
+    else:
+        return jsonify({'error': 'Missing path or board'}), 400
+    
+    if fmt == 'delta':
+        state = tree_session(game_id, data.get('token'))
+        root, records = state.delta(board, player, start_depth + depth, start_depth)
+        return records_response({
+            'format': 'delta',
+            'token': state.token,
+            'root': root,
+            'board': board,
+            'player': player,
+            'start_depth': start_depth
+        }, records)
+    if fmt != 'nested':
+        return records_response({
+            'format': 'compact',
+            'board': board,
+            'player': player,
+            'start_depth': start_depth
+        }, GameTree(game).compact_nodes(board, player, start_depth + depth, start_depth), fmt == 'msgpack')
+    node = GameTree(game).to_nested(board, player, start_depth + depth, start_depth)
+    
+    return jsonify({
+        'node': node,
+        'board': board,
+        'player': player
+    })
+
+@app.route('/game_tree/jobs', methods=['POST'])
+def start_tree_job():
+    """Build a game's tree in the background; returns a job id at once"""
+    data = request.get_json()
+    game, session = load_game(data.get('game_id'))
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 400
+    if isinstance(game, NKGame):
+        return jsonify({'error': 'Game trees are only available for 3x3 games'}), 400
+    try:
+        depth = max(1, min(int(data.get('depth', MAX_JOB_DEPTH)), MAX_JOB_DEPTH))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid depth'}), 400
+    
+    board, source = tree_root(session)
+    if game.check_winner_for_board(board) is not None:
+        return jsonify({'error': 'Game is over'}), 400
+    job_id = tree_jobs.submit(board, PLAYER_O, depth)
+    return jsonify(dict(tree_jobs.status(job_id), board=board, source=source)), 202
+
+@app.route('/game_tree/jobs/<job_id>')
+def tree_job_status(job_id):
+    """Poll a job: its progress and the deepest level finished so far"""
+    status = tree_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 400
+    return jsonify(status)
+
+@app.route('/game_tree/jobs/<job_id>/events')
+def tree_job_events(job_id):
+    """Server-sent events with each level of a job as it finishes"""
+    if tree_jobs.job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 400
+    return Response(tree_jobs.events(job_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
 
 
 if __name__ == '__main__':
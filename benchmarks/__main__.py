@@ -0,0 +1,51 @@
+import argparse
+import sys
+from benchmarks import endpoints, engine, training
+from benchmarks.harness import compare, format_value, load_report, report, save_report
+
+GROUPS = {
+    'engine': engine.run,
+    'tree': engine.bench_tree,
+    'training': training.run,
+    'endpoints': endpoints.run,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the engine, training and HTTP endpoints')
+    parser.add_argument('--groups', nargs='+', choices=list(GROUPS), default=list(GROUPS),
+                        help='Benchmark groups to run (default: all)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Compare with a saved results file; exit with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown counted as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    results = {}
+    for group in args.groups:
+        print(f'Running {group} benchmarks...', file=sys.stderr)
+        results.update(GROUPS[group]())
+
+    for name, entry in sorted(results.items()):
+        print(f"{name:40} {format_value(entry['value'], entry['unit'])}")
+
+    data = report(results)
+    if args.output:
+        save_report(data, args.output)
+        print(f"Saved results to '{args.output}'")
+
+    if args.compare:
+        baseline = load_report(args.compare)['results']
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nCompared with '{args.compare}' (positive change is worse):")
+        for name, old, new, change, regressed in rows:
+            unit = results[name]['unit']
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{name:40} {format_value(old, unit):>20} -> {format_value(new, unit):>20} {change:+7.1%}{flag}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
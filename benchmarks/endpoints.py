@@ -0,0 +1,48 @@
+from benchmarks.harness import latencies, latency_results
+
+REQUESTS = 200  # Timed requests per endpoint
+BATCH = 100     # Moves per /make_moves request
+
+
+def run(count=REQUESTS):
+    """Request latency through the Flask test client, so no network is involved"""
+    from app import app
+
+    client = app.test_client()
+
+    def new_game(_=None):
+        return client.post('/new_game', json={}).get_json()['game_id']
+
+    def played_game():
+        game_id = new_game()
+        client.post('/make_move', json={'game_id': game_id, 'row': 1, 'col': 1})
+        return game_id
+
+    def make_move(game_id):
+        client.post('/make_move', json={'game_id': game_id, 'row': 1, 'col': 1})
+
+    def game_batch():
+        return [new_game() for _ in range(BATCH)]
+
+    def make_moves(game_ids):
+        client.post('/make_moves', json={'moves': [[game_id, 1, 1] for game_id in game_ids]})
+
+    def nested_tree(game_id):
+        client.post('/game_tree', json={'game_id': game_id, 'depth': 2})
+
+    def delta_tree(game_id):
+        # First tree for the game, as the page requests it after a move
+        client.post('/game_tree', json={'game_id': game_id, 'depth': 1, 'format': 'delta'}).get_data()
+
+    # Warm the shared tables so the first timed request is not an outlier
+    nested_tree(played_game())
+
+    results = {}
+    results.update(latency_results('endpoints.new_game', latencies(new_game, count)))
+    results.update(latency_results('endpoints.make_move', latencies(make_move, count, new_game)))
+    # Per move, so it compares directly with make_move
+    samples = latencies(make_moves, max(1, count // 10), game_batch)
+    results.update(latency_results('endpoints.make_moves_per_move', [sample / BATCH for sample in samples]))
+    results.update(latency_results('endpoints.game_tree', latencies(nested_tree, count, played_game)))
+    results.update(latency_results('endpoints.game_tree_delta', latencies(delta_tree, count, played_game)))
+    return results
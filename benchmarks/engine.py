@@ -0,0 +1,83 @@
+import random
+from benchmarks.harness import per_call, peak_memory, result
+from game_engine import TicTacToeGame, Agent, PLAYER_X, PLAYER_O, EMPTY, emptystate, gameover, trained_values
+
+# Fixed line of play; trees are measured from the position before each O move
+LINE = [(1, 1, PLAYER_X), (0, 0, PLAYER_O), (0, 2, PLAYER_X), (2, 0, PLAYER_O),
+        (1, 0, PLAYER_X), (1, 2, PLAYER_O), (2, 1, PLAYER_X)]
+TREE_PLIES = (0, 1, 3, 5, 7)
+
+
+def sample_boards(count=1000, seed=0):
+    """Boards from seeded random games, finished ones included"""
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = emptystate()
+        player = PLAYER_X
+        while True:
+            boards.append([list(row) for row in board])
+            if gameover(board) != EMPTY:
+                break
+            i, j = rng.choice([(i, j) for i in range(3) for j in range(3) if board[i][j] == EMPTY])
+            board[i][j] = player
+            player = 3 - player
+    return boards[:count]
+
+def line_board(plies):
+    board = emptystate()
+    for i, j, player in LINE[:plies]:
+        board[i][j] = player
+    return board
+
+
+def bench_winner(boards):
+    game = TicTacToeGame()
+    check_rate = len(boards) / per_call(lambda: [game.check_winner_for_board(b) for b in boards])
+    gameover_rate = len(boards) / per_call(lambda: [gameover(b) for b in boards])
+    return {
+        'engine.check_winner': result(check_rate, 'boards/s', True),
+        'engine.gameover': result(gameover_rate, 'boards/s', True),
+    }
+
+def bench_agent(boards):
+    agent = Agent(PLAYER_O, learning=False, values=trained_values())
+    agent.epsilon = 0
+    # Greedy needs a move to make; lookups run on every sampled board
+    playable = [b for b in boards if gameover(b) == EMPTY]
+    return {
+        'engine.greedy': result(per_call(lambda: [agent.greedy(b) for b in playable]) / len(playable), 's'),
+        'engine.lookup': result(per_call(lambda: [agent.lookup(b) for b in boards]) / len(boards), 's'),
+    }
+
+def bench_heuristic(boards):
+    game = TicTacToeGame()
+    game.evaluate_position(boards[0], PLAYER_O)  # Builds the score table outside the timing
+    return {
+        'engine.evaluate_position': result(per_call(lambda: [game.evaluate_position(b, PLAYER_O) for b in boards]) / len(boards), 's'),
+    }
+
+def bench_tree():
+    results = {}
+    for plies in TREE_PLIES:
+        game = TicTacToeGame()
+        game.board = line_board(plies)
+        results[f'tree.ply_{plies}.time'] = result(per_call(game.generate_game_tree, repeat=3), 's')
+        results[f'tree.ply_{plies}.peak_memory'] = result(peak_memory(game.generate_game_tree), 'bytes')
+    return results
+
+def bench_init():
+    return {
+        'engine.agent_init_seeded': result(per_call(lambda: Agent(PLAYER_O), repeat=3), 's'),
+        'engine.agent_init_shared': result(per_call(lambda: Agent(PLAYER_O, values=trained_values())), 's'),
+        'engine.new_game': result(per_call(TicTacToeGame), 's'),
+    }
+
+def run():
+    boards = sample_boards()
+    results = {}
+    results.update(bench_winner(boards))
+    results.update(bench_agent(boards))
+    results.update(bench_heuristic(boards))
+    results.update(bench_init())
+    return results
@@ -0,0 +1,94 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+
+def result(value, unit, higher_is_better=False):
+    """One measurement, tagged with which direction counts as better"""
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+def per_call(fn, repeat=5):
+    """Best seconds per call of fn over repeat rounds of autoranged calls"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def peak_memory(fn):
+    """Peak bytes allocated by Python while fn runs"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def latencies(fn, count, setup=None):
+    """Seconds taken by each of count calls of fn; setup runs untimed before each"""
+    samples = []
+    for _ in range(count):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def latency_results(name, samples):
+    """Median and 95th percentile of latency samples"""
+    samples = sorted(samples)
+    return {
+        f'{name}.p50': result(statistics.median(samples), 's'),
+        f'{name}.p95': result(samples[int(0.95 * (len(samples) - 1))], 's'),
+    }
+
+
+def report(results):
+    """Results plus enough about the machine to tell runs apart"""
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+def save_report(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, threshold=0.1):
+    """Rows of (name, baseline, current, relative change, regressed)
+
+    The change is signed so that positive is always worse, whichever
+    direction the metric improves in; a change beyond threshold counts
+    as a regression. Metrics missing from either side are skipped.
+    """
+    rows = []
+    for name in sorted(results.keys() & baseline.keys()):
+        old, new = baseline[name]['value'], results[name]['value']
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if results[name]['higher_is_better']:
+            change = -change
+        rows.append((name, old, new, change, change > threshold))
+    return rows
+
+def format_value(value, unit):
+    if unit == 's':
+        for scale, suffix in ((1, 's'), (1e-3, 'ms'), (1e-6, 'µs')):
+            if value >= scale:
+                return f'{value / scale:.3f} {suffix}'
+        return f'{value / 1e-9:.1f} ns'
+    if unit == 'bytes':
+        return f'{value / 1024:.1f} KiB'
+    return f'{value:,.0f} {unit}'
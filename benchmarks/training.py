@@ -0,0 +1,36 @@
+import contextlib
+import io
+import random
+import time
+from benchmarks.harness import result
+from game_engine import Agent, PLAYER_X, PLAYER_O, play
+import train_agent
+
+SEQUENTIAL_EPISODES = 2000
+BATCHED_EPISODES = 20000
+
+
+def bench_sequential(episodes=SEQUENTIAL_EPISODES):
+    """Self-play as in train_and_save_agent, without the file writes"""
+    random.seed(0)
+    p1 = Agent(PLAYER_X, lossval=-1)
+    p2 = Agent(PLAYER_O, lossval=-1)
+    p1.epsilon = p2.epsilon = 0.3
+    start = time.perf_counter()
+    for _ in range(episodes):
+        winner = play(p1, p2)
+        p1.episode_over(winner)
+        p2.episode_over(winner)
+    return episodes / (time.perf_counter() - start)
+
+def bench_batched(episodes=BATCHED_EPISODES):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Drop the progress lines
+        train_agent.train_batched(episodes, seed=0)
+    return episodes / (time.perf_counter() - start)
+
+def run():
+    results = {'training.sequential': result(bench_sequential(), 'episodes/s', True)}
+    if train_agent.np is not None:
+        results['training.batched'] = result(bench_batched(), 'episodes/s', True)
+    return results
@@ -0,0 +1,111 @@
+from value_table import NUM_STATES, boardindex
+
+EMPTY = 0
+PLAYER_X = 1
+PLAYER_O = 2
+DRAW = 3
+
+FULL = 0b111111111  # One bit per cell, cell (i, j) being bit 3*i + j
+
+WIN_MASKS = (
+    # Rows
+    0b000000111, 0b000111000, 0b111000000,
+    # Columns
+    0b001001001, 0b010010010, 0b100100100,
+    # Diagonals
+    0b100010001, 0b001010100,
+)
+
+# Precomputed over all 512 masks so every check is a single index
+HAS_WIN = bytes(any(mask & win == win for win in WIN_MASKS) for mask in range(FULL + 1))
+MOVES = tuple(
+    tuple(divmod(cell, 3) for cell in range(9) if mask & (1 << cell))
+    for mask in range(FULL + 1)
+)
+POPCOUNT = bytes(bin(mask).count('1') for mask in range(FULL + 1))
+BASE3 = tuple(sum(3 ** cell for cell in range(9) if mask & (1 << cell)) for mask in range(FULL + 1))
+
+def _index_masks():
+    masks = [None] * NUM_STATES
+    for x in range(FULL + 1):
+        # Walk every O mask that is a subset of the cells X leaves free
+        free = FULL & ~x
+        o = free
+        while True:
+            masks[BASE3[x] + 2 * BASE3[o]] = (x, o)
+            if o == 0:
+                break
+            o = (o - 1) & free
+    return tuple(masks)
+
+# Base-3 board index -> (X mask, O mask)
+INDEX_MASKS = _index_masks()
+
+
+class BitBoard:
+    """Board state as two 9-bit masks, one for X and one for O"""
+    __slots__ = ('x', 'o')
+
+    def __init__(self, x=0, o=0):
+        self.x = x
+        self.o = o
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(*INDEX_MASKS[boardindex(board)])
+
+    @classmethod
+    def from_index(cls, index):
+        return cls(*INDEX_MASKS[index])
+
+    def to_board(self):
+        return [[self.cell(i, j) for j in range(3)] for i in range(3)]
+
+    def index(self):
+        return BASE3[self.x] + 2 * BASE3[self.o]
+
+    def cell(self, i, j):
+        bit = 1 << (3 * i + j)
+        if self.x & bit:
+            return PLAYER_X
+        if self.o & bit:
+            return PLAYER_O
+        return EMPTY
+
+    def empty(self):
+        """Mask of empty cells"""
+        return FULL & ~(self.x | self.o)
+
+    def moves(self):
+        """Empty cells as (row, col), in row-major order"""
+        return MOVES[self.empty()]
+
+    def play(self, i, j, player):
+        """New board with player's mark added at (i, j)"""
+        bit = 1 << (3 * i + j)
+        if player == PLAYER_X:
+            return BitBoard(self.x | bit, self.o)
+        return BitBoard(self.x, self.o | bit)
+
+    def winner(self):
+        """PLAYER_X, PLAYER_O, DRAW, or EMPTY while the game is still on"""
+        if HAS_WIN[self.x]:
+            return PLAYER_X
+        if HAS_WIN[self.o]:
+            return PLAYER_O
+        if self.x | self.o == FULL:
+            return DRAW
+        return EMPTY
+
+    def to_move(self):
+        """Player whose turn it is, assuming X moved first"""
+        return PLAYER_X if POPCOUNT[self.x] == POPCOUNT[self.o] else PLAYER_O
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.x == other.x and self.o == other.o
+
+    def __hash__(self):
+        return hash((self.x, self.o))
+
+    def __repr__(self):
+        return f"BitBoard(x={self.x:#011b}, o={self.o:#011b})"
@@ -1,17 +1,28 @@
+import os
 import random
+from array import array
+from collections import ChainMap
 from copy import deepcopy
+from bitboard import BitBoard, INDEX_MASKS, POPCOUNT, WIN_MASKS, EMPTY, PLAYER_X, PLAYER_O, DRAW
+from metrics import AGENT_LOOKUPS, MOVE_ANALYSIS
+from symmetry import CanonicalValues
+from state_space import state_space
+from value_table import ValueArray, boardindex, indexboard
+from valuefile import load_values
 
-EMPTY = 0
-PLAYER_X = 1
-PLAYER_O = 2
-DRAW = 3
+OPPONENTS = ('trained', 'perfect')  # AI move sources a game can use
+
+# Lookup counters, resolved once since lookup runs on every move considered
+LOOKUP_HITS = AGENT_LOOKUPS.labels('hit')
+LOOKUP_MISSES = AGENT_LOOKUPS.labels('miss')
 
 class TicTacToeGame:
-    def __init__(self):
+    def __init__(self, opponent='trained'):
         self.board = [[EMPTY, EMPTY, EMPTY] for _ in range(3)]
-        self.ai_agent = Agent(PLAYER_O, learning=False)
+        self.opponent = opponent
+        # All games reference the same read-only trained table
+        self.ai_agent = Agent(PLAYER_O, learning=False, values=trained_values())
         self.ai_agent.epsilon = 0
-        self.load_trained_values()
     
     def is_valid_move(self, row, col):
         return 0 <= row < 3 and 0 <= col < 3 and self.board[row][col] == EMPTY
@@ -23,50 +34,38 @@ class TicTacToeGame:
         return False
     
     def check_winner(self):
-        for i in range(3):
-            if self.board[i][0] != EMPTY and self.board[i][0] == self.board[i][1] == self.board[i][2]:
-                return self.board[i][0]
-            if self.board[0][i] != EMPTY and self.board[0][i] == self.board[1][i] == self.board[2][i]:
-                return self.board[0][i]
-        
-        if self.board[0][0] != EMPTY and self.board[0][0] == self.board[1][1] == self.board[2][2]:
-            return self.board[0][0]
-        if self.board[0][2] != EMPTY and self.board[0][2] == self.board[1][1] == self.board[2][0]:
-            return self.board[0][2]
-        
-        if all(self.board[i][j] != EMPTY for i in range(3) for j in range(3)):
-            return DRAW
-        
-        return None
+        return self.check_winner_for_board(self.board)
     
     def ai_move(self):
         if self.check_winner():
             return None
         
-        move = self.ai_agent.action(self.board)
-        return move
+        if self.opponent == 'perfect':
+            # Any move the solver proves optimal, chosen at random
+            from solver import solved_table
+            return random.choice(solved_table().best_moves(self.board, PLAYER_O))
+        
+        agent = self.ai_agent
+        if agent.learning:
+            # Learning agents need action() to track state for backups
+            return agent.action(self.board)
+        if random.random() < agent.epsilon:
+            return agent.random(self.board)
+        # Same choice as Agent.greedy, from the cached analysis
+        return random.choice(self.analyze_moves()[1])
     
     def get_move_values(self):
         move_values = {}
         if self.check_winner():
             return move_values
-            
-        maxval = -50000
-        best_moves = []
         
-        for i in range(3):
-            for j in range(3):
-                if self.board[i][j] == EMPTY:
-                    self.board[i][j] = PLAYER_O
-                    val = self.ai_agent.lookup(self.board)
-                    self.board[i][j] = EMPTY
-                    move_values[f"{i},{j}"] = round(val, 4)
-                    
-                    if val > maxval:
-                        maxval = val
-                        best_moves = [(i, j)]
-                    elif val == maxval:
-                        best_moves.append((i, j))
+        with MOVE_ANALYSIS.time():
+            if self.opponent == 'perfect':
+                # Show what the solver decides on, not the trained table
+                values, best_moves = self.solved_moves()
+            else:
+                values, best_moves = self.analyze_moves()
+        move_values.update(values)
         
         # Add info about tie-breaking
         if len(best_moves) > 1:
@@ -74,144 +73,40 @@ class TicTacToeGame:
         
         return move_values
     
+    def analyze_moves(self):
+        """Rounded value of each AI move and the list of best moves"""
+        agent = self.ai_agent
+        return analyze_position(agent.values, self.board, agent.player, agent.lossval)
+    
+    def solved_moves(self):
+        """Perfect-play result of each AI move (1 win, 0 draw, -1 loss) and the optimal moves"""
+        from solver import solved_table
+        solved = solved_table()
+        move_values = {}
+        for i, j in BitBoard.from_board(self.board).moves():
+            self.board[i][j] = PLAYER_O
+            move_values[f"{i},{j}"] = float(solved.outcome(self.board, PLAYER_O))
+            self.board[i][j] = EMPTY
+        return move_values, list(solved.best_moves(self.board, PLAYER_O))
+    
     def generate_game_tree(self, max_depth=None):
         """Generate complete game tree until game ends"""
-        def create_tree_node(board, player, current_depth):
-            winner = self.check_winner_for_board(board)
-            if winner is not None:  # Game ended
-                return None
-            
-            # Stop at max_depth if specified, but allow deeper generation for value calculation
-            if max_depth is not None and current_depth > max_depth:
-                return None
-            
-            node = {
-                'board': deepcopy(board),
-                'player': player,
-                'moves': [],
-                'depth': current_depth,
-                'expanded': current_depth == 0  # Only root is expanded by default
-            }
-            
-            # Generate all possible moves for current player
-            for i in range(3):
-                for j in range(3):
-                    if board[i][j] == EMPTY:
-                        # Create new board with this move
-                        new_board = deepcopy(board)
-                        new_board[i][j] = player
-                        
-                        # Get value based on player - use actual trained values
-                        temp_board = deepcopy(board)
-                        temp_board[i][j] = player
-                        
-                        # Get the state tuple key to check if it exists in trained values
-                        state_key = self.ai_agent.statetuple(temp_board)
-                        
-                        if state_key in self.ai_agent.values:
-                            # Use the actual trained value
-                            value = self.ai_agent.values[state_key]
-                        else:
-                            # If not in trained values, evaluate the position more intelligently
-                            winner = self.check_winner_for_board(temp_board)
-                            if winner == self.ai_agent.player:
-                                value = 1.0
-                            elif winner == EMPTY:
-                                # For non-terminal positions without trained values, use a basic heuristic
-                                value = self.evaluate_position(temp_board, player)
-                                # Ensure we don't return exactly 0 (which causes display issues)
-                                if value == 0.0:
-                                    value = 0.001
-                            elif winner == DRAW:
-                                value = 0.0
-                            else:
-                                value = self.ai_agent.lossval
-                            
-                        
-                        # Create child node recursively (continue generating deeper levels)
-                        child_node = create_tree_node(new_board, 3 - player, current_depth + 1)
-                        
-                        # Check if child node has moves
-                        has_children = child_node is not None and child_node.get('moves') and len(child_node.get('moves', [])) > 0
-                        
-                        move_info = {
-                            'position': (i, j),
-                            'value': value,  # Use exact value, no rounding
-                            'board': deepcopy(new_board),
-                            'player': player,
-                            'child': child_node,
-                            'has_children': has_children
-                        }
-                        node['moves'].append(move_info)
-                        
-            
-            # Sort moves by value
-            if player == PLAYER_O:  # AI moves - highest first
-                node['moves'].sort(key=lambda x: x['value'], reverse=True)
-            else:  # Human moves - we can sort by human advantage
-                node['moves'].sort(key=lambda x: x['value'], reverse=True)
-            
-            return node
-        
-        tree = create_tree_node(self.board, PLAYER_O, 0)
+        from game_tree import GameTree
+
+        # Identical positions are built once in a shared DAG, then emitted
+        # as the nested structure the frontend expects
+        tree = GameTree(self).to_nested(self.board, PLAYER_O, max_depth)
         return tree
     
     def evaluate_position(self, board, player):
         """Basic heuristic evaluation for positions without trained values"""
-        # Simple evaluation based on potential wins and blocks
-        score = 0.0
-        
-        # Check all lines (rows, columns, diagonals)
-        lines = [
-            # Rows
-            [(0,0), (0,1), (0,2)], [(1,0), (1,1), (1,2)], [(2,0), (2,1), (2,2)],
-            # Columns  
-            [(0,0), (1,0), (2,0)], [(0,1), (1,1), (2,1)], [(0,2), (1,2), (2,2)],
-            # Diagonals
-            [(0,0), (1,1), (2,2)], [(0,2), (1,1), (2,0)]
-        ]
-        
-        for line in lines:
-            player_count = sum(1 for (i,j) in line if board[i][j] == player)
-            opponent_count = sum(1 for (i,j) in line if board[i][j] == (3 - player))
-            empty_count = sum(1 for (i,j) in line if board[i][j] == EMPTY)
-            
-            if player_count == 2 and empty_count == 1:
-                score += 0.5  # Two in a row, can win
-            elif player_count == 1 and empty_count == 2:
-                score += 0.1  # One in a row, potential
-            elif opponent_count == 2 and empty_count == 1:
-                score -= 0.6  # Opponent can win, must block
-            elif opponent_count == 1 and empty_count == 2:
-                score -= 0.1  # Opponent has potential
-        
-        # Favor center position
-        if board[1][1] == player:
-            score += 0.2
-        elif board[1][1] == (3 - player):
-            score -= 0.2
-            
-        # Return a value between 0 and 1 (scaled and shifted)
-        evaluated_value = max(0.001, min(0.999, 0.5 + score * 0.2))
-        return evaluated_value
+        # Looked up from scores precomputed for every board
+        return heuristic_scores()[player][boardindex(board)]
     
     def check_winner_for_board(self, board):
         """Check winner for a specific board state"""
-        for i in range(3):
-            if board[i][0] != EMPTY and board[i][0] == board[i][1] == board[i][2]:
-                return board[i][0]
-            if board[0][i] != EMPTY and board[0][i] == board[1][i] == board[2][i]:
-                return board[0][i]
-        
-        if board[0][0] != EMPTY and board[0][0] == board[1][1] == board[2][2]:
-            return board[0][0]
-        if board[0][2] != EMPTY and board[0][2] == board[1][1] == board[2][0]:
-            return board[0][2]
-        
-        if all(board[i][j] != EMPTY for i in range(3) for j in range(3)):
-            return DRAW
-        
-        return None
+        winner = gameover(board)
+        return None if winner == EMPTY else winner
     
     def get_state(self):
         return {
@@ -224,66 +119,183 @@ class TicTacToeGame:
         self.ai_agent.values = dict(state['ai_values'])
     
     def load_trained_values(self):
-        try:
-            import pickle
-            with open('trained_agent_values.pkl', 'rb') as f:
-                trained_values = pickle.load(f)
-                self.ai_agent.values = trained_values
-                print(f"Loaded {len(trained_values)} trained states")
-        except FileNotFoundError:
-            print("No trained values found. Using default untrained agent.")
-        except Exception as e:
-            print(f"Error loading trained values: {e}")
-            print("Using default untrained agent.")
-
-def enumstates(state, idx, agent):
-    if idx > 8:
-        player = last_to_act(state)
-        if player == agent.player:
-            agent.add(state)
+        self.ai_agent.values = trained_values().view()
+
+# Resolved next to this module so the app can start from any directory
+TRAINED_BINARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trained_agent_values.bin')
+TRAINED_PICKLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trained_agent_values.pkl')
+
+_trained_values = None
+
+def trained_values():
+    """Trained values, loaded once per process and shared read-only"""
+    global _trained_values
+    if _trained_values is None:
+        _trained_values = read_trained_values()
+    return _trained_values
+
+def read_trained_values():
+    """Memory-map the binary value file, falling back to the pickle
+
+    Every writer of trained values saves both files together (see
+    train_agent.save_trained_values), so the binary is always current.
+    """
+    try:
+        values = load_values(TRAINED_BINARY)
+        print(f"Loaded {len(values)} trained states")
+        return values
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error loading {TRAINED_BINARY}: {e}")
+
+    values = None
+    try:
+        import pickle
+        with open(TRAINED_PICKLE, 'rb') as f:
+            values = pickle.load(f)
+            print(f"Loaded {len(values)} trained states")
+    except FileNotFoundError:
+        print("No trained values found. Using default untrained agent.")
+    except Exception as e:
+        print(f"Error loading trained values: {e}")
+        print("Using default untrained agent.")
+    if values is None:
+        values = Agent(PLAYER_O, learning=False).values
+    # Store as a flat array so lookups skip tuple building and hashing
+    if isinstance(values, CanonicalValues):
+        # One value per symmetry class, as saved by symmetric training
+        return CanonicalValues(ValueArray.from_dict(values.table).view())
+    return ValueArray.from_dict(values).view()
+
+def analyze_position(values, board, player, lossval=0):
+    """Rounded value of each of player's moves on board and the list of best moves
+
+    With a fixed value table this is a pure function of the board, so
+    results are memoised in the table's cache and shared by every game
+    reading the same table; any write to the table drops the cache.
+    Moves to boards the table lacks score what Agent.add would store for
+    them, without writing, so a shared table and its cache stay intact.
+    """
+    index = boardindex(board)
+    key = ('moves', index, player, lossval)
+    cache = getattr(values, 'cache', None)
+    if cache is not None and key in cache:
+        return cache[key]
+    
+    bits = BitBoard.from_board(board)
+    by_index = isinstance(values, (ValueArray, CanonicalValues))
+    rows = [list(row) for row in board]
+    move_values = {}
+    maxval = -50000
+    best_moves = []
+    
+    for i, j in bits.moves():
+        if by_index:
+            state = index + player * 3 ** (3 * i + j)
+        else:
+            rows[i][j] = player
+            state = (tuple(rows[0]), tuple(rows[1]), tuple(rows[2]))
+            rows[i][j] = EMPTY
+        if state in values:
+            LOOKUP_HITS.inc()
+            val = values[state]
+        else:
+            LOOKUP_MISSES.inc()
+            val = winner_value(bits.play(i, j, player).winner(), player, lossval)
+        move_values[f"{i},{j}"] = round(val, 4)
+        
+        if val > maxval:
+            maxval = val
+            best_moves = [(i, j)]
+        elif val == maxval:
+            best_moves.append((i, j))
+    
+    analysis = (move_values, best_moves)
+    if cache is not None:
+        cache[key] = analysis
+    return analysis
+
+def analyze_boards(boards, player=PLAYER_O):
+    """analyze_position for many boards against the trained table
+
+    Each distinct board is analysed once; the results land in the
+    table's cache, where every game's analyze_moves finds them.
+    """
+    values = trained_values()
+    return [analyze_position(values, board, player) for board in boards]
+
+def winner_value(winner, player, lossval=0):
+    """Value of a finished (or ongoing, EMPTY) game for player, as Agent.add stores it"""
+    if winner == player:
+        return 1
+    elif winner == EMPTY:
+        return 0.5
+    elif winner == DRAW:
+        return 0
     else:
-        winner = gameover(state)
-        if winner != EMPTY:
-            return
-        i = int(idx / 3)
-        j = int(idx % 3)
-        for val in range(3):
-            state[i][j] = val
-            enumstates(state, idx+1, agent)
-
-def last_to_act(state):
-    countx = 0
-    counto = 0
-    for i in range(3):
-        for j in range(3):
-            if state[i][j] == PLAYER_X:
-                countx += 1
-            elif state[i][j] == PLAYER_O:
-                counto += 1
-    if countx == counto:
-        return PLAYER_O
-    if countx == (counto + 1):
-        return PLAYER_X
-    return -1
+        return lossval
+
+_heuristic_scores = None
+
+def heuristic_scores():
+    """evaluate_position of every base-3 board index, as arrays indexed by player
+
+    Built once per process from the line masks, in the line order and
+    with the arithmetic the old per-call loop used, so every score is
+    exactly the value it returned.
+    """
+    global _heuristic_scores
+    if _heuristic_scores is None:
+        center = 1 << 4
+        tables = {PLAYER_X: array('d'), PLAYER_O: array('d')}
+        for x, o in INDEX_MASKS:
+            for player, table in tables.items():
+                mine, theirs = (x, o) if player == PLAYER_X else (o, x)
+                score = 0.0
+                for line in WIN_MASKS:
+                    player_count = POPCOUNT[mine & line]
+                    opponent_count = POPCOUNT[theirs & line]
+                    empty_count = 3 - player_count - opponent_count
+                    
+                    if player_count == 2 and empty_count == 1:
+                        score += 0.5  # Two in a row, can win
+                    elif player_count == 1 and empty_count == 2:
+                        score += 0.1  # One in a row, potential
+                    elif opponent_count == 2 and empty_count == 1:
+                        score -= 0.6  # Opponent can win, must block
+                    elif opponent_count == 1 and empty_count == 2:
+                        score -= 0.1  # Opponent has potential
+                
+                # Favor center position
+                if mine & center:
+                    score += 0.2
+                elif theirs & center:
+                    score -= 0.2
+                
+                # A value between 0 and 1 (scaled and shifted)
+                table.append(max(0.001, min(0.999, 0.5 + score * 0.2)))
+        _heuristic_scores = (None, tables[PLAYER_X], tables[PLAYER_O])
+    return _heuristic_scores
+
+_seeds = {}
+
+def seed_values(agent):
+    """Starting table for an agent: every reachable position it has just
+    moved into, valued as Agent.add would value it. Built once per player
+    and lossval, so each new Agent only copies a dict."""
+    key = (agent.player, agent.lossval)
+    if key not in _seeds:
+        space = state_space()
+        _seeds[key] = {indexboard(space.index[n]): agent.winnerval(space.winner[n])
+                       for n in space.last_moved_by(agent.player)}
+    return _seeds[key]
 
 def gameover(state):
-    for i in range(3):
-        if state[i][0] != EMPTY and state[i][0] == state[i][1] and state[i][0] == state[i][2]:
-            return state[i][0]
-        if state[0][i] != EMPTY and state[0][i] == state[1][i] and state[0][i] == state[2][i]:
-            return state[0][i]
-    if state[0][0] != EMPTY and state[0][0] == state[1][1] and state[0][0] == state[2][2]:
-        return state[0][0]
-    if state[0][2] != EMPTY and state[0][2] == state[1][1] and state[0][2] == state[2][0]:
-        return state[0][2]
-    for i in range(3):
-        for j in range(3):
-            if state[i][j] == EMPTY:
-                return EMPTY
-    return DRAW
+    return BitBoard.from_board(state).winner()
 
 class Agent:
-    def __init__(self, player, verbose=False, lossval=0, learning=True):
+    def __init__(self, player, verbose=False, lossval=0, learning=True, values=None):
         self.values = {}
         self.player = player
         self.verbose = verbose
@@ -294,7 +306,14 @@ class Agent:
         self.prevstate = None
         self.prevscore = 0
         self.count = 0
-        enumstates([[EMPTY,EMPTY,EMPTY],[EMPTY,EMPTY,EMPTY],[EMPTY,EMPTY,EMPTY]], 0, self)
+        if isinstance(values, (ValueArray, CanonicalValues)):
+            # Share the entries; they are copied on this agent's first write
+            self.values = values.view()
+        elif values is not None:
+            # Share the given table; writes land in a private layer on top
+            self.values = ChainMap({}, values)
+        else:
+            self.values = dict(seed_values(self))
 
     def episode_over(self, winner):
         self.backup(self.winnerval(winner))
@@ -310,35 +329,29 @@ class Agent:
 
         # Set up state tracking for learning
         state[move[0]][move[1]] = self.player
-        self.prevstate = self.statetuple(state)
+        self.prevstate = self.statekey(state)
         self.prevscore = self.lookup(state)
         state[move[0]][move[1]] = EMPTY
         return move
 
     def random(self, state):
-        available = []
-        for i in range(3):
-            for j in range(3):
-                if state[i][j] == EMPTY:
-                    available.append((i,j))
+        available = BitBoard.from_board(state).moves()
         return random.choice(available)
 
     def greedy(self, state):
         maxval = -50000
         best_moves = []
         
-        for i in range(3):
-            for j in range(3):
-                if state[i][j] == EMPTY:
-                    state[i][j] = self.player
-                    val = self.lookup(state)
-                    state[i][j] = EMPTY
-                    
-                    if val > maxval:
-                        maxval = val
-                        best_moves = [(i, j)]
-                    elif val == maxval:
-                        best_moves.append((i, j))
+        for i, j in BitBoard.from_board(state).moves():
+            state[i][j] = self.player
+            val = self.lookup(state)
+            state[i][j] = EMPTY
+            
+            if val > maxval:
+                maxval = val
+                best_moves = [(i, j)]
+            elif val == maxval:
+                best_moves.append((i, j))
         
         # Random tie-breaking when multiple moves have same value
         maxmove = random.choice(best_moves) if best_moves else None
@@ -360,41 +373,46 @@ class Agent:
             self.values[self.prevstate] += self.alpha * (nextval - self.prevscore)
 
     def lookup(self, state):
-        key = self.statetuple(state)
+        key = self.statekey(state)
         if not key in self.values:
-            self.add(key)
+            LOOKUP_MISSES.inc()
+            self.add(state)
+        else:
+            LOOKUP_HITS.inc()
         return self.values[key]
 
     def add(self, state):
         winner = gameover(state)
-        tup = self.statetuple(state)
-        self.values[tup] = self.winnerval(winner)
+        key = self.statekey(state)
+        self.values[key] = self.winnerval(winner)
 
     def winnerval(self, winner):
-        if winner == self.player:
-            return 1
-        elif winner == EMPTY:
-            return 0.5
-        elif winner == DRAW:
-            return 0
-        else:
-            return self.lossval
+        return winner_value(winner, self.player, self.lossval)
 
     def statetuple(self, state):
         return (tuple(state[0]),tuple(state[1]),tuple(state[2]))
 
+    def statekey(self, state):
+        """Key for state in self.values: an index for array tables"""
+        if isinstance(self.values, (ValueArray, CanonicalValues)):
+            return boardindex(state)
+        return self.statetuple(state)
+
 def emptystate():
     return [[EMPTY,EMPTY,EMPTY],[EMPTY,EMPTY,EMPTY],[EMPTY,EMPTY,EMPTY]]
 
 def play(agent1, agent2):
     state = emptystate()
+    bits = BitBoard()
     for i in range(9):
         if i % 2 == 0:
             move = agent1.action(state)
         else:
             move = agent2.action(state)
         state[move[0]][move[1]] = (i % 2) + 1
-        winner = gameover(state)
+        # Keep the bitboard in step so the winner check is a table lookup
+        bits = bits.play(move[0], move[1], (i % 2) + 1)
+        winner = bits.winner()
         if winner != EMPTY:
             return winner
     return winner
\ No newline at end of file
@@ -0,0 +1,293 @@
+import secrets
+import threading
+from collections import deque
+from bitboard import BitBoard
+from game_engine import EMPTY, PLAYER_O, DRAW
+from metrics import TREE_BUILD, TREE_NODES
+from solver import solved_table
+from symmetry import IDENTITY, INVERSE, CanonicalValues, canonical, inverse_move, transform_board
+from value_table import indexboard
+
+# Tree build timers, resolved once per format
+NESTED_BUILD = TREE_BUILD.labels('nested')
+COMPACT_BUILD = TREE_BUILD.labels('compact')
+DELTA_BUILD = TREE_BUILD.labels('delta')
+
+
+def boardstring(board):
+    """Board as 9 digits, row by row, as used in compact tree records"""
+    return ''.join(str(cell) for row in board for cell in row)
+
+def follows(later, board):
+    """True if later could arise from board: every mark on board is on later"""
+    return all(cell == EMPTY or later[i][j] == cell
+               for i, row in enumerate(board) for j, cell in enumerate(row))
+
+
+class GameTree:
+    """Game tree stored as a DAG: every unique (board, player) is one node."""
+
+    def __init__(self, game):
+        self.game = game
+        self.agent = game.ai_agent
+        self.solved = solved_table()
+        # With one value per symmetry class, symmetric positions share a node
+        self.symmetric = isinstance(self.agent.values, CanonicalValues)
+        # Transposition table: (board tuple, player to move) -> node
+        self.nodes = {}
+        # Symmetric mode: class nodes mapped onto other orientations
+        self.oriented = {}
+
+    def node(self, board, player):
+        """Return the shared node for a position, building it on first use"""
+        if not self.symmetric:
+            return self.build(board, player)
+
+        key = (self.agent.statetuple(board), player)
+        if key in self.oriented:
+            return self.oriented[key]
+        index, t = canonical(board)
+        node = self.build(indexboard(index), player)
+        if node is None or t == IDENTITY:
+            return node
+
+        # Map the class's node back onto this board's orientation
+        moves = sorted(
+            (dict(move, position=inverse_move(move['position'], t),
+                  board=transform_board(move['board'], INVERSE[t]))
+             for move in node['moves']),
+            key=lambda x: x['position'])
+        moves.sort(key=lambda x: x['value'], reverse=True)
+        self.oriented[key] = {'board': key[0], 'player': player, 'moves': moves}
+        return self.oriented[key]
+
+    def build(self, board, player):
+        """Node for exactly this board, cached in the transposition table"""
+        key = (self.agent.statetuple(board), player)
+        if key in self.nodes:
+            return self.nodes[key]
+
+        bits = BitBoard.from_board(board)
+        if bits.winner() != EMPTY:  # Game ended
+            self.nodes[key] = None
+            return None
+
+        moves = []
+        for i, j in bits.moves():
+            new_board = [list(row) for row in board]
+            new_board[i][j] = player
+            moves.append({
+                'position': (i, j),
+                'value': self.move_value(new_board, player),
+                'outcome': self.move_outcome(new_board, player),
+                'board': key[0][:i] + (tuple(new_board[i]),) + key[0][i + 1:],
+                'player': player,
+            })
+
+        # Sort moves by value (stable, so equal values keep board order)
+        moves.sort(key=lambda x: x['value'], reverse=True)
+
+        # Children are built lazily, only when a caller walks into them
+        node = {'board': key[0], 'player': player, 'moves': moves}
+        self.nodes[key] = node
+        TREE_NODES.inc()
+        return node
+
+    def move_value(self, board, player):
+        """Value shown for the position reached by a move"""
+        state_key = self.agent.statekey(board)
+        if state_key in self.agent.values:
+            # Use the actual trained value
+            return self.agent.values[state_key]
+
+        # If not in trained values, evaluate the position more intelligently
+        winner = self.game.check_winner_for_board(board)
+        if winner == self.agent.player:
+            return 1.0
+        elif winner == EMPTY:
+            # For non-terminal positions without trained values, use a basic heuristic
+            value = self.game.evaluate_position(board, player)
+            # Ensure we don't return exactly 0 (which causes display issues)
+            if value == 0.0:
+                value = 0.001
+            return value
+        elif winner == DRAW:
+            return 0.0
+        return self.agent.lossval
+
+    def move_outcome(self, board, player):
+        """Perfect-play result of a move for its player: 1, 0 or -1"""
+        try:
+            return self.solved.outcome(board, player)
+        except KeyError:  # Position cannot arise with this player to move
+            return None
+
+    def to_nested(self, board, player=PLAYER_O, max_depth=None, start_depth=0):
+        """Emit the nested dict structure the frontend expects
+
+        Nodes deeper than max_depth are left out; their parent move still
+        reports has_children so the client can expand it on demand.
+        """
+        emitted = {}
+
+        def emit(board, player, current_depth):
+            node = self.node(board, player)
+            if node is None:
+                return None
+            if max_depth is not None and current_depth > max_depth:
+                return None
+
+            # A position always sits at the same depth below the root, so
+            # transposed positions can share one emitted dict
+            key = (node['board'], player)
+            if key in emitted:
+                return emitted[key]
+
+            result = {
+                'board': [list(row) for row in node['board']],
+                'player': player,
+                'moves': [],
+                'depth': current_depth,
+                'expanded': current_depth == 0  # Only root is expanded by default
+            }
+            for move in node['moves']:
+                child_node = emit(move['board'], 3 - player, current_depth + 1)
+                child = self.node(move['board'], 3 - player)
+                has_children = child is not None and len(child['moves']) > 0
+                result['moves'].append({
+                    'position': move['position'],
+                    'value': move['value'],
+                    'outcome': move['outcome'],
+                    'board': [list(row) for row in move['board']],
+                    'player': player,
+                    'child': child_node,
+                    'has_children': has_children
+                })
+            emitted[key] = result
+            return result
+
+        with NESTED_BUILD.time():
+            return emit(board, player, start_depth)
+
+    def compact_nodes(self, board, player=PLAYER_O, max_depth=None, start_depth=0):
+        """Yield the tree as compact node records, one per unique position
+
+        Each record is [board, moves]: the board as a 9-character string
+        (row-major, one digit per cell) and each move as [cell, value,
+        outcome, child]. child is the index of the child's record, None
+        if the game ends there, or -1 if the child lies beyond max_depth.
+        Records come in breadth-first order with the root first; the
+        player to move alternates by depth from player at the root.
+        """
+        # Records are streamed: the consumer's time between them is not counted
+        return COMPACT_BUILD.time_iter(self._compact_records(board, player, max_depth, start_depth))
+
+    def _compact_records(self, board, player, max_depth, start_depth):
+        root = self.node(board, player)
+        if root is None or (max_depth is not None and start_depth > max_depth):
+            return
+        ids = {(root['board'], player): 0}
+        queue = deque([(root, player, start_depth)])
+        while queue:
+            node, player, depth = queue.popleft()
+            moves = []
+            for move in node['moves']:
+                child = self.node(move['board'], 3 - player)
+                if child is None:
+                    ref = None
+                elif max_depth is not None and depth + 1 > max_depth:
+                    ref = -1
+                else:
+                    key = (child['board'], 3 - player)
+                    if key not in ids:
+                        ids[key] = len(ids)
+                        queue.append((child, 3 - player, depth + 1))
+                    ref = ids[key]
+                i, j = move['position']
+                moves.append([3 * i + j, move['value'], move['outcome'], ref])
+            yield [boardstring(node['board']), moves]
+
+
+class TreeSession:
+    """A game's place in a shared tree, so each reply sends only what is new
+
+    Positions get ids that stay fixed for the life of the session and a
+    reply lists only the records the client has not been sent yet; the
+    rest of the tree is referenced by id. token names the numbering: a
+    client holding another token must drop its records and start over.
+    The GameTree itself holds nothing per game, so sessions over the same
+    values share one and keep only their ids and sent records.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.token = secrets.token_hex(8)
+        self.ids = {}      # (board tuple, player to move) -> id
+        self.sent = set()  # Ids whose records the client already holds
+        self.next_id = 0
+        self.root = None
+        self.lock = threading.Lock()  # One request at a time per game
+
+    def node_id(self, board, player):
+        """Fixed id of a position, or None if the game has ended there"""
+        node = self.tree.node(board, player)
+        if node is None:
+            return None
+        key = (node['board'], player)
+        if key not in self.ids:
+            self.ids[key] = self.next_id
+            self.next_id += 1
+        return self.ids[key]
+
+    def reroot(self, board, player):
+        """Move the root to board, forgetting ids of positions it cannot lead to"""
+        key = (self.tree.agent.statetuple(board), player)
+        if key == self.root:
+            return
+        self.ids = {k: node_id for k, node_id in self.ids.items() if follows(k[0], board)}
+        self.sent &= set(self.ids.values())
+        self.root = key
+
+    def delta(self, board, player=PLAYER_O, max_depth=None, start_depth=0, reroot=False):
+        """(root id, records not sent before) for one request
+
+        The records are built in full under the session's lock and only
+        then marked as sent, so concurrent requests for the same game
+        cannot each assume the other delivered a record. A client whose
+        response fails to arrive should drop its token and start over.
+        """
+        with self.lock:
+            if reroot:
+                self.reroot(board, player)
+            root_id = self.node_id(board, player)
+            with DELTA_BUILD.time():
+                records = list(self.delta_nodes(board, player, max_depth, start_depth))
+            self.sent.update(record[0] for record in records)
+        return root_id, records
+
+    def delta_nodes(self, board, player=PLAYER_O, max_depth=None, start_depth=0):
+        """Yield records for the positions within max_depth not sent before
+
+        Records are [id, board, moves], laid out as in
+        GameTree.compact_nodes except that child is the child's id, or
+        None if the game ends there. A child whose record the client has
+        never received lies beyond the depth fetched so far.
+        """
+        root_id = self.node_id(board, player)
+        if root_id is None or (max_depth is not None and start_depth > max_depth):
+            return
+        seen = {root_id}
+        queue = deque([(self.tree.node(board, player), player, start_depth)])
+        while queue:
+            node, player, depth = queue.popleft()
+            moves = []
+            for move in node['moves']:
+                ref = self.node_id(move['board'], 3 - player)
+                if ref is not None and ref not in seen and (max_depth is None or depth + 1 <= max_depth):
+                    seen.add(ref)
+                    queue.append((self.tree.node(move['board'], 3 - player), 3 - player, depth + 1))
+                i, j = move['position']
+                moves.append([3 * i + j, move['value'], move['outcome'], ref])
+            node_id = self.ids[(node['board'], player)]
+            if node_id not in self.sent:
+                yield [node_id, boardstring(node['board']), moves]
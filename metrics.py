@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached lookup up to a full tree build
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []  # Every metric, in the order /metrics lists them
+
+
+def _labeltext(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Named metric with optional labels, listed on the /metrics page
+
+    labels(*values) returns the child for one combination of label
+    values; keep the child around on hot paths to skip the label lookup.
+    Metrics without labels have a single child, updated through the
+    metric itself.
+    """
+
+    kind = 'untyped'
+    child = None  # Factory for the per-label-values state
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        if self.child is not None and not self.labelnames:
+            self.labels()  # Listed as zero before the first update
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.child())
+        return child
+
+    def samples(self):
+        for values, child in sorted(self.children.items()):
+            for suffix, extra, value in child.samples():
+                yield self.name + suffix + _labeltext(self.labelnames, values, extra), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name} {_number(value)}' for name, value in self.samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        # No lock: counters sit on hot paths like Agent.lookup, where one
+        # would cost more than the lookup itself. Racing threads can at
+        # worst lose an increment, which monitoring can live with
+        self.value += amount
+
+    def samples(self):
+        yield '', (), self.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+    child = _CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[n] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def time_iter(self, iterable):
+        """Yield from iterable, observing only the time spent producing items
+
+        Time the consumer spends between items (say, streaming them to a
+        client) is left out. The observation is made when iteration ends,
+        even if the consumer stops early.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(elapsed)
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '_bucket', (('le', _number(bound)),), total
+        yield '_bucket', (('le', '+Inf'),), self.count
+        yield '_sum', (), self.sum
+        yield '_count', (), self.count
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def time_iter(self, iterable):
+        return self.labels().time_iter(iterable)
+
+
+class Gauge(Metric):
+    """Value read when /metrics is requested, from a callback"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self):
+        yield self.name, self.read()
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Engine metrics, updated by app, game_engine, game_tree and tree_jobs
+GAMES_CREATED = Counter('tictactoe_games_created_total', 'Games started through /new_game, by opponent', ['opponent'])
+GAME_CREATION = Histogram('tictactoe_game_creation_seconds', 'Time spent creating and storing a new game in /new_game')
+AGENT_LOOKUPS = Counter('tictactoe_agent_lookups_total', 'Agent.lookup calls, by whether the board had a value', ['result'])
+MOVE_ANALYSIS = Histogram('tictactoe_move_analysis_seconds', 'Time spent in TicTacToeGame.get_move_values')
+TREE_NODES = Counter('tictactoe_tree_nodes_created_total', 'Game tree nodes built (each unique position once per tree)')
+TREE_BUILD = Histogram('tictactoe_tree_build_seconds',
+                       'Time spent building game trees, by format (nested, compact, delta, or job for background builds)',
+                       ['format'])
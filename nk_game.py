@@ -0,0 +1,313 @@
+import threading
+import time
+from bitboard import EMPTY, PLAYER_X, PLAYER_O, DRAW
+
+EXACT, LOWER, UPPER = 0, 1, 2  # Transposition table bounds
+DEFAULT_DEPTH = 6         # Deepest iteration of the AI's search
+DEFAULT_TIME_LIMIT = 1.0  # Seconds the AI may search per move
+MAX_TABLE_ENTRIES = 1000000
+
+
+class Geometry:
+    """Line masks of a size x size board where k in a row wins
+
+    Cell (row, col) is bit row*size + col. Every k-cell line is one mask,
+    and each cell lists the lines through it, so a win check after a move
+    only looks at those.
+    """
+
+    def __init__(self, size, k):
+        if not 3 <= k <= size:
+            raise ValueError(f"Need 3 <= k <= size, got size {size} and k {k}")
+        self.size = size
+        self.k = k
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+        lines = []
+        for r in range(size):
+            for c in range(size):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    if 0 <= r + dr * (k - 1) < size and 0 <= c + dc * (k - 1) < size:
+                        lines.append(sum(1 << ((r + dr * n) * size + c + dc * n) for n in range(k)))
+        self.lines = tuple(lines)
+        self.through = tuple(tuple(line for line in lines if line >> cell & 1) for cell in range(self.cells))
+        # Cells on more lines (the centre) are searched first
+        self.order = tuple(sorted(range(self.cells), key=lambda cell: -len(self.through[cell])))
+        # Heuristic weight of a line holding n marks of one player only
+        self.weights = tuple(0 if n == 0 else 10 ** (n - 1) for n in range(k))
+        self.win_score = len(lines) * 10 ** k  # Beyond any heuristic score
+
+    def wins(self, mask, cell):
+        """True if mask, which includes cell, completes a line through cell"""
+        for line in self.through[cell]:
+            if mask & line == line:
+                return True
+        return False
+
+    def winner(self, x, o):
+        """PLAYER_X, PLAYER_O, DRAW, or EMPTY while the game goes on"""
+        for line in self.lines:
+            if x & line == line:
+                return PLAYER_X
+            if o & line == line:
+                return PLAYER_O
+        return DRAW if x | o == self.full else EMPTY
+
+    def evaluate(self, x, o, player):
+        """Open-line heuristic for player to move; a line counts only if one side holds it"""
+        weights = self.weights
+        score = 0
+        for line in self.lines:
+            xs = x & line
+            os = o & line
+            if xs and not os:
+                score += weights[bin(xs).count('1')]
+            elif os and not xs:
+                score -= weights[bin(os).count('1')]
+        return score if player == PLAYER_X else -score
+
+_geometries = {}
+
+def geometry(size, k):
+    if (size, k) not in _geometries:
+        _geometries[(size, k)] = Geometry(size, k)
+    return _geometries[(size, k)]
+
+
+class Timeout(Exception):
+    pass
+
+
+class Search:
+    """One search's deadline and node count, over a Searcher's shared table
+
+    Every call to Searcher.search gets its own Search, so requests searching the same board size at once never see each
+    other's deadline.
+    """
+
+    def __init__(self, searcher, deadline=None):
+        self.searcher = searcher
+        self.geo = searcher.geo
+        self.table = searcher.table
+        self.deadline = deadline
+        self.nodes = 0
+
+    def negamax(self, x, o, player, depth, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise Timeout
+
+        key = (x, o, player)
+        entry = self.table.get(key)
+        first = None
+        if entry is not None:
+            stored_depth, score, bound, first = entry
+            if stored_depth >= depth and (bound == EXACT
+                                          or (bound == LOWER and score >= beta)
+                                          or (bound == UPPER and score <= alpha)):
+                return score
+
+        geo = self.geo
+        mine = x if player == PLAYER_X else o
+        moves = self.searcher.moves(x, o, first)
+        for cell in moves:
+            if geo.wins(mine | 1 << cell, cell):
+                return geo.win_score + depth
+        if depth == 0:
+            return geo.evaluate(x, o, player)
+
+        start_alpha = alpha
+        best, best_cell = None, moves[0]
+        for cell in moves:
+            bit = 1 << cell
+            if (x | o | bit) == geo.full:
+                score = 0
+            elif player == PLAYER_X:
+                score = -self.negamax(x | bit, o, PLAYER_O, depth - 1, -beta, -alpha)
+            else:
+                score = -self.negamax(x, o | bit, PLAYER_X, depth - 1, -beta, -alpha)
+            if best is None or score > best:
+                best, best_cell = score, cell
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+        bound = UPPER if best <= start_alpha else LOWER if best >= beta else EXACT
+        self.searcher.store(key, (depth, best, bound, best_cell))
+        return best
+
+    def root(self, x, o, player, depth):
+        """(score, cell, scores) of the best move at one depth
+
+        scores maps every move to its score: exact for the best move, and
+        for the others the bound alpha-beta cut them off at, which is
+        never above the best move's score.
+        """
+        geo = self.geo
+        window = 2 * geo.win_score
+        entry = self.table.get((x, o, player))
+        mine = x if player == PLAYER_X else o
+        alpha, best_cell = -window, None
+        scores = {}
+        for cell in self.searcher.moves(x, o, entry[3] if entry else None):
+            bit = 1 << cell
+            if geo.wins(mine | bit, cell):
+                # Only reached at depth 1, where the other moves are cheap
+                score = geo.win_score + depth
+            elif (x | o | bit) == geo.full:
+                score = 0
+            elif player == PLAYER_X:
+                score = -self.negamax(x | bit, o, PLAYER_O, depth - 1, -window, -alpha)
+            else:
+                score = -self.negamax(x, o | bit, PLAYER_X, depth - 1, -window, -alpha)
+            scores[cell] = score
+            if best_cell is None or score > alpha:
+                alpha, best_cell = score, cell
+        self.searcher.store((x, o, player), (depth, alpha, EXACT, best_cell))
+        return alpha, best_cell, scores
+
+
+class Searcher:
+    """Depth-limited negamax with alpha-beta pruning and a transposition table
+
+    Scores are from the point of view of the player to move: a win scores
+    win_score plus the depth left, so faster wins rank higher; anything
+    else is the open-line heuristic at the search horizon. The table only
+    holds positions the search has visited and is cleared when it grows
+    past max_entries, so memory stays bounded on any board size.
+
+    One Searcher serves every thread. Entries are facts about a position
+    at a depth, so any search may use another's; reads need no lock, and
+    writes take one so a clear never races an insert.
+    """
+
+    def __init__(self, geo, max_entries=MAX_TABLE_ENTRIES):
+        self.geo = geo
+        self.max_entries = max_entries
+        self.table = {}  # (x, o, player) -> (depth, score, bound, best cell)
+        self.lock = threading.Lock()
+
+    def moves(self, x, o, first=None):
+        occupied = x | o
+        moves = [cell for cell in self.geo.order if not occupied >> cell & 1]
+        if first is not None:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def store(self, key, entry):
+        with self.lock:
+            if len(self.table) >= self.max_entries:
+                self.table.clear()
+            self.table[key] = entry
+
+    def search(self, x, o, player, max_depth=DEFAULT_DEPTH, time_limit=None):
+        """(score, cell, scores) of the best move, deepening until max_depth or the time limit
+
+        Each iteration seeds the next one's move ordering through the
+        table; the result of the last finished iteration is returned,
+        with every move's score as Search.root gives it. Depth 1 always
+        finishes, so there is always a move.
+        """
+        if x | o == self.geo.full:
+            raise ValueError("No moves left")
+        start = time.perf_counter()
+        result = None
+        search = Search(self)
+        for depth in range(1, max_depth + 1):
+            if depth > 1 and time_limit is not None:
+                search.deadline = start + time_limit
+            try:
+                result = search.root(x, o, player, depth)
+            except Timeout:
+                break
+            if abs(result[0]) >= self.geo.win_score:
+                break  # Forced result found; deeper search cannot change it
+        return result
+
+_searchers = {}
+
+def searcher(size, k):
+    """Searcher for a board size, shared by every game in the process"""
+    if (size, k) not in _searchers:
+        _searchers[(size, k)] = Searcher(geometry(size, k))
+    return _searchers[(size, k)]
+
+
+class NKGame:
+    """size x size game where k in a row wins, with a searching AI as O
+
+    Offers the methods app.py uses on TicTacToeGame, so larger variants
+    can be played through the same endpoints.
+    """
+
+    def __init__(self, size=4, k=4, depth=DEFAULT_DEPTH, time_limit=DEFAULT_TIME_LIMIT):
+        self.geo = geometry(size, k)
+        self.searcher = searcher(size, k)
+        self.size = size
+        self.k = k
+        self.depth = depth
+        self.time_limit = time_limit
+        self.board = [[EMPTY] * size for _ in range(size)]
+        self.planned = None  # (masks, cell, scores) of the last search
+
+    def masks(self):
+        x = o = 0
+        for i, row in enumerate(self.board):
+            for j, cell in enumerate(row):
+                if cell == PLAYER_X:
+                    x |= 1 << (i * self.size + j)
+                elif cell == PLAYER_O:
+                    o |= 1 << (i * self.size + j)
+        return x, o
+
+    def is_valid_move(self, row, col):
+        return 0 <= row < self.size and 0 <= col < self.size and self.board[row][col] == EMPTY
+
+    def make_move(self, row, col, player):
+        if self.is_valid_move(row, col):
+            self.board[row][col] = player
+            return True
+        return False
+
+    def check_winner(self):
+        winner = self.geo.winner(*self.masks())
+        return None if winner == EMPTY else winner
+
+    def ai_move(self):
+        if self.check_winner():
+            return None
+        cell, _ = self.plan()
+        return divmod(cell, self.size)
+
+    def get_move_values(self):
+        """Value of each AI move on the 0-1 scale the 3x3 game uses
+
+        Values come from the same search ai_move plays from, so the move
+        it picks is never outranked: its value is exact, and the others
+        show the bound the search cut them off at. 1 and 0 are forced
+        wins and losses within the search horizon, values in between come
+        from the heuristic.
+        """
+        if self.check_winner():
+            return {}
+        _, scores = self.plan()
+        return {f"{cell // self.size},{cell % self.size}": round(self.to_value(score), 4)
+                for cell, score in scores.items()}
+
+    def plan(self):
+        """(cell, scores) from one search of the current board, reused until it changes"""
+        x, o = self.masks()
+        if self.planned is None or self.planned[0] != (x, o):
+            _, cell, scores = self.searcher.search(x, o, PLAYER_O, self.depth, self.time_limit)
+            self.planned = ((x, o), cell, scores)
+        return self.planned[1], self.planned[2]
+
+    def to_value(self, score):
+        if score >= self.geo.win_score:
+            return 1.0
+        if score <= -self.geo.win_score:
+            return 0.0
+        # One open line a mark short of winning moves the value by 0.25
+        return max(0.001, min(0.999, 0.5 + score * 0.25 / self.geo.weights[-1]))
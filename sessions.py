@@ -0,0 +1,142 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_TTL = 3600  # Seconds a game may sit idle before it is dropped
+
+
+def new_session(opponent='trained', size=3, k=3):
+    """Compact per-game state: everything else is rebuilt from shared tables"""
+    return {
+        'board': [[0] * size for _ in range(size)],
+        'moves': [],          # [row, col, player] in the order played
+        'opponent': opponent,
+        'decision': None,     # Board and move values behind the last AI move
+        'size': size,         # Board is size x size, k in a row wins
+        'k': k,
+    }
+
+def new_game_id():
+    return secrets.token_hex(8)
+
+
+class MemorySessionStore:
+    """In-process session store with LRU eviction and an idle timeout"""
+
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()  # game_id -> (last used, session)
+        self.lock = threading.Lock()
+
+    def get(self, game_id):
+        with self.lock:
+            entry = self.sessions.get(game_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.sessions[game_id]
+                return None
+            self.sessions[game_id] = (time.monotonic(), entry[1])
+            self.sessions.move_to_end(game_id)
+            return entry[1]
+
+    def put(self, game_id, session):
+        with self.lock:
+            self.sessions[game_id] = (time.monotonic(), session)
+            self.sessions.move_to_end(game_id)
+            self._evict()
+
+    def delete(self, game_id):
+        with self.lock:
+            self.sessions.pop(game_id, None)
+
+    def _evict(self):
+        # Oldest entries sit at the front: drop the idle ones, then the
+        # least recently used until we are back under the limit
+        now = time.monotonic()
+        while self.sessions:
+            game_id, (last_used, _) = next(iter(self.sessions.items()))
+            if now - last_used <= self.ttl and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[game_id]
+
+    def __len__(self):
+        with self.lock:
+            self._evict()
+            return len(self.sessions)
+
+
+class SQLiteSessionStore:
+    """Session store in a SQLite file, shared by every worker process"""
+
+    def __init__(self, path, max_sessions=DEFAULT_MAX_SESSIONS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                       'game_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)')
+
+    @contextmanager
+    def _connect(self):
+        """One transaction on a fresh connection, closed afterwards
+
+        A connection per call keeps the store safe across threads and
+        processes; the connection's own context manager only commits.
+        """
+        with closing(sqlite3.connect(self.path, timeout=10)) as db:
+            with db:
+                yield db
+
+    def get(self, game_id):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute('SELECT data FROM sessions WHERE game_id = ? AND last_used >= ?',
+                             (game_id, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE sessions SET last_used = ? WHERE game_id = ?', (now, game_id))
+        return json.loads(row[0])
+
+    def put(self, game_id, session):
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO sessions (game_id, data, last_used) VALUES (?, ?, ?)',
+                       (game_id, json.dumps(session), now))
+            self._evict(db, now)
+
+    def delete(self, game_id):
+        with self._connect() as db:
+            db.execute('DELETE FROM sessions WHERE game_id = ?', (game_id,))
+
+    def _evict(self, db, now):
+        db.execute('DELETE FROM sessions WHERE last_used < ?', (now - self.ttl,))
+        db.execute('DELETE FROM sessions WHERE game_id IN ('
+                   'SELECT game_id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                   (self.max_sessions,))
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute('SELECT COUNT(*) FROM sessions WHERE last_used >= ?',
+                              (time.time() - self.ttl,)).fetchone()[0]
+
+
+def create_store(backend=None, path=None, max_sessions=None, ttl=None):
+    """Session store configured from arguments or SESSION_* environment variables"""
+    backend = backend or os.environ.get('SESSION_BACKEND', 'memory')
+    max_sessions = max_sessions or int(os.environ.get('SESSION_MAX', DEFAULT_MAX_SESSIONS))
+    ttl = ttl or float(os.environ.get('SESSION_TTL', DEFAULT_TTL))
+    if backend == 'memory':
+        return MemorySessionStore(max_sessions, ttl)
+    if backend == 'sqlite':
+        path = path or os.environ.get('SESSION_DB', 'sessions.db')
+        return SQLiteSessionStore(path, max_sessions, ttl)
+    raise ValueError(f"Unknown session backend: {backend}")
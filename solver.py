@@ -0,0 +1,182 @@
+import os
+import sys
+from array import array
+from bitboard import BitBoard, EMPTY, PLAYER_X, PLAYER_O, DRAW, MOVES, FULL, HAS_WIN
+from value_table import NUM_STATES, boardindex
+
+SOLVED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solved_positions.bin')
+MAGIC = b'TTTS'
+VERSION = 1
+UNSOLVED = -128  # Score of boards that cannot occur with this player to move
+
+
+class SolvedTable:
+    """Game-theoretic value and optimal moves of every reachable position
+
+    Scores are from the point of view of the player to move: 1 win,
+    0 draw, -1 loss with perfect play. Best moves are 9-bit masks of the
+    cells that achieve the score. Both tables have one row per player to
+    move, so boards where O opens (as in the tree view) are covered too.
+    """
+
+    def __init__(self, scores, best):
+        self.scores = scores  # [player - 1] -> array('b') by board index
+        self.best = best      # [player - 1] -> array('H') by board index
+
+    @classmethod
+    def solve(cls):
+        scores = [array('b', [UNSOLVED]) * NUM_STATES for _ in range(2)]
+        best = [array('H', [0]) * NUM_STATES for _ in range(2)]
+
+        def negamax(x, o, player):
+            index = BitBoard(x, o).index()
+            score = scores[player - 1][index]
+            if score != UNSOLVED:
+                return score
+
+            mine, theirs = (x, o) if player == PLAYER_X else (o, x)
+            if HAS_WIN[theirs]:
+                score, moves = -1, 0
+            elif x | o == FULL:
+                score, moves = 0, 0
+            else:
+                # Every position is needed exactly, so search the full
+                # window; alpha-beta would leave pruned children as bounds
+                score, moves = -2, 0
+                for i, j in MOVES[FULL & ~(x | o)]:
+                    bit = 1 << (3 * i + j)
+                    if player == PLAYER_X:
+                        value = -negamax(x | bit, o, PLAYER_O)
+                    else:
+                        value = -negamax(x, o | bit, PLAYER_X)
+                    if value > score:
+                        score, moves = value, bit
+                    elif value == score:
+                        moves |= bit
+
+            scores[player - 1][index] = score
+            best[player - 1][index] = moves
+            return score
+
+        negamax(0, 0, PLAYER_X)
+        negamax(0, 0, PLAYER_O)
+        return cls(scores, best)
+
+    @classmethod
+    def load(cls, path=SOLVED_FILE):
+        with open(path, 'rb') as f:
+            header = f.read(8)
+            if header[:4] != MAGIC or int.from_bytes(header[4:], 'little') != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} solved table")
+            scores = []
+            for _ in range(2):
+                table = array('b')
+                table.fromfile(f, NUM_STATES)
+                scores.append(table)
+            best = []
+            for _ in range(2):
+                table = array('H')
+                table.fromfile(f, NUM_STATES)
+                if sys.byteorder != 'little':
+                    table.byteswap()
+                best.append(table)
+        return cls(scores, best)
+
+    def save(self, path=SOLVED_FILE):
+        with open(path, 'wb') as f:
+            f.write(MAGIC + VERSION.to_bytes(4, 'little'))
+            for table in self.scores:
+                table.tofile(f)
+            for table in self.best:
+                if sys.byteorder != 'little':
+                    table = array('H', table)
+                    table.byteswap()
+                table.tofile(f)
+
+    def score(self, board, player):
+        """Result for player, to move on board, with perfect play"""
+        score = self.scores[player - 1][boardindex(board)]
+        if score == UNSOLVED:
+            raise KeyError(f"{board} cannot occur with player {player} to move")
+        return score
+
+    def best_moves(self, board, player):
+        """Optimal (row, col) moves for player on board"""
+        return MOVES[self.best[player - 1][boardindex(board)]]
+
+    def outcome(self, board, player):
+        """Result for player of the move that produced board"""
+        return -self.score(board, 3 - player)
+
+
+_solved = None
+
+def solved_table():
+    """Solved table, loaded once per process (solved on the spot if missing)"""
+    global _solved
+    if _solved is None:
+        try:
+            _solved = SolvedTable.load()
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Could not load solved positions ({e}); solving now.")
+            _solved = SolvedTable.solve()
+    return _solved
+
+def evaluate_values(values, player=PLAYER_O, lossval=-1):
+    """Compare a learned value table with perfect play for player
+
+    For every reachable position where player is to move, checks whether
+    the moves with the highest learned value are all optimal, and measures
+    how far each move's learned value is from the exact result scored the
+    way Agent.winnerval scores a finished game.
+    """
+    from game_engine import Agent
+
+    solved = solved_table()
+    agent = Agent(player, lossval=lossval, learning=False, values=values)
+    exact = {1: agent.winnerval(player), 0: agent.winnerval(DRAW), -1: agent.winnerval(3 - player)}
+    positions = agreeing = moves_seen = 0
+    error = 0.0
+    for index in range(NUM_STATES):
+        if solved.scores[player - 1][index] == UNSOLVED:
+            continue
+        bits = BitBoard.from_index(index)
+        if bits.winner() != EMPTY:
+            continue
+        board = bits.to_board()
+        learned = {}
+        for i, j in bits.moves():
+            board[i][j] = player
+            learned[(i, j)] = agent.lookup(board)
+            error += abs(learned[(i, j)] - exact[solved.outcome(board, player)])
+            board[i][j] = EMPTY
+            moves_seen += 1
+        top = max(learned.values())
+        positions += 1
+        if {move for move, value in learned.items() if value == top} <= set(solved.best_moves(board, player)):
+            agreeing += 1
+    return {
+        'positions': positions,
+        'agreement': agreeing / positions,
+        'mean_abs_error': error / moves_seen,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description='Solve tic-tac-toe and compare learned values with perfect play')
+    parser.add_argument('--values', default='trained_agent_values.pkl',
+                        help='Value table to compare (default: trained_agent_values.pkl)')
+    args = parser.parse_args()
+
+    table = SolvedTable.solve()
+    table.save()
+    _solved = table
+    print(f"Saved solved positions to '{SOLVED_FILE}'")
+
+    with open(args.values, 'rb') as f:
+        report = evaluate_values(pickle.load(f))
+    print(f"Positions with O to move: {report['positions']}")
+    print(f"Greedy moves that are optimal: {report['agreement']:.1%}")
+    print(f"Mean distance from exact move values: {report['mean_abs_error']:.3f}")
@@ -0,0 +1,58 @@
+from array import array
+from collections import deque
+from bitboard import BitBoard, EMPTY, PLAYER_X
+from value_table import NUM_STATES
+
+
+class StateSpace:
+    """Every position reachable from the empty board, in breadth-first order
+
+    State n is the board with base-3 index index[n]; to_move[n] is the
+    player whose turn it is, winner[n] the BitBoard.winner result and
+    moves[n] the 9-bit mask of legal moves (0 once the game is over).
+    Agents seed their tables from it and batched training reads its
+    winners and legal moves.
+    """
+
+    def __init__(self, first=PLAYER_X):
+        self.first = first
+        self.index = array('H')
+        self.to_move = array('B')
+        self.winner = array('B')
+        self.moves = array('H')
+
+        queue = deque([(BitBoard(), first)])
+        seen = bytearray(NUM_STATES)  # Board indices already queued
+        seen[0] = 1
+        while queue:
+            bits, player = queue.popleft()
+            winner = bits.winner()
+            moves = bits.empty() if winner == EMPTY else 0
+            self.index.append(bits.index())
+            self.to_move.append(player)
+            self.winner.append(winner)
+            self.moves.append(moves)
+            for cell in range(9):
+                if moves >> cell & 1:
+                    child = bits.play(cell // 3, cell % 3, player)
+                    index = child.index()
+                    if not seen[index]:
+                        seen[index] = 1
+                        queue.append((child, 3 - player))
+
+    def __len__(self):
+        return len(self.index)
+
+    def last_moved_by(self, player):
+        """States where player made the last move (the empty board counts
+        as the second player's, as it did for the old enumstates)"""
+        return [n for n in range(len(self.index)) if self.to_move[n] != player]
+
+
+_spaces = {}
+
+def state_space(first=PLAYER_X):
+    """State space for games where first opens, built once per process"""
+    if first not in _spaces:
+        _spaces[first] = StateSpace(first)
+    return _spaces[first]
@@ -0,0 +1,151 @@
+from collections import ChainMap
+from collections.abc import MutableMapping
+from array import array
+from bitboard import BASE3, FULL, INDEX_MASKS
+from value_table import NUM_STATES, ValueArray, boardindex, indexboard
+
+IDENTITY = 0
+
+def _apply(r, c, turns, flip):
+    if flip:
+        c = 2 - c
+    for _ in range(turns):
+        r, c = c, 2 - r
+    return r, c
+
+# The 8 symmetries: 4 rotations, each with and without a mirror.
+# Cell c = 3*i + j moves to cell CELL_MAPS[t][c] under transform t
+CELL_MAPS = tuple(
+    tuple(3 * i + j for i, j in (_apply(r, c, turns, flip) for r in range(3) for c in range(3)))
+    for flip in (False, True) for turns in range(4)
+)
+INVERSE = tuple(CELL_MAPS.index(tuple(cells.index(k) for k in range(9))) for cells in CELL_MAPS)
+
+# Transformed 9-bit masks, one table per symmetry
+MASK_MAPS = tuple(
+    tuple(sum(1 << cells[c] for c in range(9) if mask & (1 << c)) for mask in range(FULL + 1))
+    for cells in CELL_MAPS
+)
+
+_canonical = None
+_transform = None
+
+def _tables():
+    """Canonical index and transform of every board, built on first use"""
+    global _canonical, _transform
+    if _canonical is None:
+        canonical = array('H', bytes(2 * NUM_STATES))
+        transform = array('B', bytes(NUM_STATES))
+        for index, (x, o) in enumerate(INDEX_MASKS):
+            best, best_t = index, IDENTITY
+            for t in range(1, 8):
+                other = BASE3[MASK_MAPS[t][x]] + 2 * BASE3[MASK_MAPS[t][o]]
+                if other < best:
+                    best, best_t = other, t
+            canonical[index] = best
+            transform[index] = best_t
+        _canonical, _transform = canonical, transform
+    return _canonical, _transform
+
+def canonical(board):
+    """(canonical index, transform) of a board
+
+    The canonical form is the lowest base-3 index among the board's
+    8 symmetric images; the transform maps the board onto it.
+    """
+    return canonical_index(boardindex(board))
+
+def canonical_index(index):
+    canonical, transform = _tables()
+    return canonical[index], transform[index]
+
+def transform_move(move, t):
+    """Where cell (row, col) lands under transform t"""
+    return divmod(CELL_MAPS[t][3 * move[0] + move[1]], 3)
+
+def inverse_move(move, t):
+    """Cell that transform t maps onto (row, col)"""
+    return transform_move(move, INVERSE[t])
+
+def transform_board(board, t):
+    """Board tuple, in statetuple form, with transform t applied"""
+    cells = [0] * 9
+    for i in range(3):
+        for j in range(3):
+            cells[CELL_MAPS[t][3 * i + j]] = board[i][j]
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
+class CanonicalValues(MutableMapping):
+    """Value table storing one entry per symmetry class
+
+    Any board (list, statetuple or base-3 index) is mapped to its
+    canonical form before reaching the underlying table, so an update to
+    one board updates all 8 of its symmetric images. The underlying table
+    is a dict keyed by canonical statetuples or a ValueArray.
+    """
+
+    def __init__(self, table=None):
+        self.table = {} if table is None else table
+
+    @classmethod
+    def from_dict(cls, values):
+        """Fold a full table into classes, averaging each class's values"""
+        totals = {}
+        for key, value in values.items():
+            index = canonical(key)[0]
+            total, count = totals.get(index, (0.0, 0))
+            totals[index] = (total + value, count + 1)
+        table = ValueArray()
+        for index, (total, count) in totals.items():
+            table[index] = total / count
+        return cls(table)
+
+    def expand(self):
+        """Full dict with an entry for every board of every stored class"""
+        canonical_of, _ = _tables()
+        values = {}
+        for index in range(NUM_STATES):
+            key = self._key(canonical_of[index])
+            if key in self.table:
+                values[indexboard(index)] = self.table[key]
+        return values
+
+    def view(self):
+        """Table sharing this one's entries, with writes kept private"""
+        if isinstance(self.table, ValueArray):
+            return CanonicalValues(self.table.view())
+        return CanonicalValues(ChainMap({}, self.table))
+
+    @property
+    def cache(self):
+        return getattr(self.table, 'cache', None)
+
+    def _key(self, key):
+        index = key if isinstance(key, int) else boardindex(key)
+        index = _tables()[0][index]
+        if isinstance(self.table, ValueArray):
+            return index
+        return indexboard(index)
+
+    def __contains__(self, key):
+        return self._key(key) in self.table
+
+    def __getitem__(self, key):
+        return self.table[self._key(key)]
+
+    def __setitem__(self, key, value):
+        self.table[self._key(key)] = value
+
+    def __delitem__(self, key):
+        del self.table[self._key(key)]
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __reduce__(self):
+        # Pickle just the canonical entries as a plain dict
+        return (CanonicalValues, (dict(self.table.items()),))
@@ -0,0 +1,235 @@
+import argparse
+import math
+import os
+import pickle
+import random
+import sys
+import time
+from multiprocessing import Pool
+from bitboard import FULL, HAS_WIN, INDEX_MASKS, MOVES, EMPTY, PLAYER_X, PLAYER_O, DRAW
+from symmetry import CanonicalValues
+from value_table import ValueArray
+from valuefile import load_values
+
+POLICIES = ('random', 'heuristic', 'perfect', 'trained')  # Or a path to a value file
+POW3 = tuple(3 ** cell for cell in range(9))
+# Cells set in each 9-bit mask, as cell numbers 3*i + j
+CELLS = tuple(tuple(3 * i + j for i, j in MOVES[mask]) for mask in range(FULL + 1))
+CHUNK = 10000  # Games per pool task
+
+
+class RandomPolicy:
+    def move(self, x, o, index, player, rng):
+        return rng.choice(CELLS[FULL & ~(x | o)])
+
+
+class TablePolicy:
+    """Greedy play from a value table, as Agent.greedy plays it
+
+    Boards without a value score what Agent.add would give them, so the
+    policy matches an Agent with epsilon 0 and the same lossval.
+    """
+
+    def __init__(self, values, player, lossval=0):
+        scores = {player: 1, EMPTY: 0.5, DRAW: 0, 3 - player: lossval}
+        self.values = []
+        for index, (xmask, omask) in enumerate(INDEX_MASKS):
+            value = values.get(index)
+            if value is None:
+                if HAS_WIN[xmask]:
+                    winner = PLAYER_X
+                elif HAS_WIN[omask]:
+                    winner = PLAYER_O
+                else:
+                    winner = DRAW if xmask | omask == FULL else EMPTY
+                value = scores[winner]
+            self.values.append(value)
+
+    def move(self, x, o, index, player, rng):
+        values = self.values
+        best, moves = None, []
+        for cell in CELLS[FULL & ~(x | o)]:
+            value = values[index + player * POW3[cell]]
+            if best is None or value > best:
+                best, moves = value, [cell]
+            elif value == best:
+                moves.append(cell)
+        return rng.choice(moves)
+
+
+class HeuristicPolicy:
+    """Takes a win when there is one, otherwise the move evaluate_position likes best"""
+
+    def __init__(self):
+        from game_engine import heuristic_scores
+        self.scores = heuristic_scores()  # evaluate_position by player and board index
+
+    def move(self, x, o, index, player, rng):
+        mine = x if player == PLAYER_X else o
+        cells = CELLS[FULL & ~(x | o)]
+        wins = [cell for cell in cells if HAS_WIN[mine | 1 << cell]]
+        if wins:
+            return rng.choice(wins)
+        best, moves = None, []
+        for cell in cells:
+            value = self.scores[player][index + player * POW3[cell]]
+            if best is None or value > best:
+                best, moves = value, [cell]
+            elif value == best:
+                moves.append(cell)
+        return rng.choice(moves)
+
+
+class PerfectPolicy:
+    """A random one of the moves the solver proves optimal"""
+
+    def __init__(self):
+        from solver import solved_table
+        self.best = solved_table().best
+
+    def move(self, x, o, index, player, rng):
+        return rng.choice(CELLS[self.best[player - 1][index]])
+
+
+def load_table(path):
+    """Value table from a .bin or .pkl file, readable by base-3 index"""
+    if path.endswith('.bin'):
+        return load_values(path)
+    with open(path, 'rb') as f:
+        values = pickle.load(f)
+    if isinstance(values, CanonicalValues):
+        return values
+    return ValueArray.from_dict(values)
+
+_policies = {}
+
+def make_policy(spec, player):
+    """Policy for a spec, built once per process and side"""
+    key = (spec, player)
+    if key not in _policies:
+        if spec == 'random':
+            _policies[key] = RandomPolicy()
+        elif spec == 'heuristic':
+            _policies[key] = HeuristicPolicy()
+        elif spec == 'perfect':
+            _policies[key] = PerfectPolicy()
+        elif spec == 'trained':
+            from game_engine import trained_values
+            _policies[key] = TablePolicy(trained_values(), player)
+        else:
+            _policies[key] = TablePolicy(load_table(spec), player)
+    return _policies[key]
+
+
+def play_games(task):
+    """Play a chunk of games; counts indexed by winner (PLAYER_X, PLAYER_O, DRAW)"""
+    x_spec, o_spec, count, seed = task
+    policies = {PLAYER_X: make_policy(x_spec, PLAYER_X), PLAYER_O: make_policy(o_spec, PLAYER_O)}
+    rng = random.Random(seed)
+    counts = [0, 0, 0, 0]
+    for _ in range(count):
+        x = o = index = 0
+        player = PLAYER_X
+        while True:
+            cell = policies[player].move(x, o, index, player, rng)
+            index += player * POW3[cell]
+            if player == PLAYER_X:
+                x |= 1 << cell
+                mine = x
+            else:
+                o |= 1 << cell
+                mine = o
+            if HAS_WIN[mine]:
+                winner = player
+                break
+            if x | o == FULL:
+                winner = DRAW
+                break
+            player = 3 - player
+        counts[winner] += 1
+    return counts
+
+def run_match(x_spec, o_spec, games, pool=None, seed=0):
+    """Winner counts and games/sec for games between two policies"""
+    tasks = [(x_spec, o_spec, min(CHUNK, games - start), seed * 1000003 + n)
+             for n, start in enumerate(range(0, games, CHUNK))]
+    start = time.perf_counter()
+    results = pool.map(play_games, tasks) if pool else map(play_games, tasks)
+    counts = [sum(column) for column in zip(*results)]
+    elapsed = time.perf_counter() - start
+    return counts, games / elapsed
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """95% Wilson score interval for a proportion"""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+def summarize(counts, player):
+    """Win/draw/loss rates for player with their intervals"""
+    games = sum(counts)
+    summary = {'games': games}
+    for outcome, winner in (('win', player), ('draw', DRAW), ('loss', 3 - player)):
+        low, high = wilson_interval(counts[winner], games)
+        summary[outcome] = {'rate': counts[winner] / games, 'low': low, 'high': high}
+    return summary
+
+def worse(candidate, baseline):
+    """True if candidate loses significantly more or wins significantly less"""
+    return (candidate['loss']['low'] > baseline['loss']['high']
+            or candidate['win']['high'] < baseline['win']['low'])
+
+
+def tournament(agent, opponents, side=PLAYER_O, games=100000, workers=None, seed=0):
+    """Match the agent against each opponent; summaries by opponent"""
+    results = {}
+    with Pool(workers or os.cpu_count()) as pool:
+        for opponent in opponents:
+            x_spec, o_spec = (opponent, agent) if side == PLAYER_O else (agent, opponent)
+            counts, rate = run_match(x_spec, o_spec, games, pool, seed)
+            results[opponent] = dict(summarize(counts, side), games_per_sec=rate)
+    return results
+
+def print_results(name, results):
+    print(f"{name}:")
+    for opponent, summary in results.items():
+        rates = '  '.join(f"{outcome} {summary[outcome]['rate']:6.2%} "
+                          f"[{summary[outcome]['low']:.2%}, {summary[outcome]['high']:.2%}]"
+                          for outcome in ('win', 'draw', 'loss'))
+        print(f"  vs {opponent:10} {rates}  ({summary['games_per_sec']:,.0f} games/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Play many games between policies and report win/draw/loss rates')
+    parser.add_argument('--agent', default='trained',
+                        help='Policy under test: one of %s or a value file (default: trained)' % ', '.join(POLICIES))
+    parser.add_argument('--opponents', nargs='+', default=['random', 'heuristic', 'perfect'],
+                        help='Policies to play against (default: random heuristic perfect)')
+    parser.add_argument('--side', choices=['X', 'O'], default='O',
+                        help='Side the agent plays; value tables only know their own side (default: O)')
+    parser.add_argument('--games', type=int, default=100000, help='Games per opponent (default: 100000)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help='Policy to compare with; exit with status 1 if the agent is significantly weaker')
+    args = parser.parse_args()
+
+    for spec in [args.agent, args.baseline, *args.opponents]:
+        if spec is not None and spec not in POLICIES and not os.path.exists(spec):
+            parser.error(f"unknown policy or missing file: {spec}")
+    side = PLAYER_O if args.side == 'O' else PLAYER_X
+
+    results = tournament(args.agent, args.opponents, side, args.games, args.workers, args.seed)
+    print_results(args.agent, results)
+    if args.baseline:
+        baseline = tournament(args.baseline, args.opponents, side, args.games, args.workers, args.seed)
+        print_results(args.baseline, baseline)
+        weaker = [opponent for opponent in args.opponents if worse(results[opponent], baseline[opponent])]
+        if weaker:
+            print(f"{args.agent} is significantly weaker than {args.baseline} against: {', '.join(weaker)}")
+            sys.exit(1)
+        print(f"{args.agent} is not significantly weaker than {args.baseline}")
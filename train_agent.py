@@ -1,20 +1,58 @@
 import pickle
 import argparse
-from game_engine import Agent, PLAYER_O, PLAYER_X
+import os
+import random
+import time
+from multiprocessing import Pool
+from bitboard import EMPTY, PLAYER_X, PLAYER_O, DRAW
+from game_engine import Agent, play
+from state_space import state_space
+from symmetry import CanonicalValues
+from value_table import NUM_STATES, ValueArray, boardindex, indexboard
+from valuefile import read_values, save_delta, save_values
 
-def train_and_save_agent(episodes=100000):
+try:
+    import numpy as np
+except ImportError:  # Only needed for batched training
+    np = None
+
+def train_and_save_agent(episodes=100000, symmetric=False, seed=None, checkpoint=None,
+                         checkpoint_every=10000, resume=False, init_values=None, delta_base=None):
     print("Training agents with more exploration...")
+    # The base may be the very file this run overwrites, so read it first
+    base = read_values(delta_base) if delta_base else None
     
     # Create two agents for self-play training
     p1 = Agent(PLAYER_X, lossval=-1)
     p2 = Agent(PLAYER_O, lossval=-1)
+    start = 0
+    if seed is not None:
+        random.seed(seed)
+
+    if resume:
+        state = load_checkpoint(checkpoint, 'sequential')
+        p1.values, p2.values = state['values']
+        p1.epsilon, p2.epsilon = state['epsilon']
+        random.setstate(state['random'])
+        start = state['episode']
+        print(f"Resuming from episode {start}")
+    else:
+        if init_values:
+            # Continue training O from an existing table
+            p2.values = read_values(init_values)
+
+        if symmetric:
+            # One entry per symmetry class, so each update covers all 8 images
+            p1.values = CanonicalValues.from_dict(p1.values)
+            if not isinstance(p2.values, CanonicalValues):
+                p2.values = CanonicalValues.from_dict(p2.values)
     
-    # Increase exploration initially
-    p1.epsilon = 0.3  # More exploration
-    p2.epsilon = 0.3
+        # Increase exploration initially
+        p1.epsilon = 0.3  # More exploration
+        p2.epsilon = 0.3
     
     # Train through self-play
-    for i in range(episodes):  # More training games
+    for i in range(start, episodes):  # More training games
         if i % 10000 == 0:
             print(f'Training game: {i}')
 
@@ -24,23 +62,362 @@ def train_and_save_agent(episodes=100000):
             p2.epsilon = max(0.1, p2.epsilon * 0.99)
         
         # Play a game between the two agents
-        from game_engine import play
         winner = play(p1, p2)
         p1.episode_over(winner)
         p2.episode_over(winner)
+
+        if checkpoint and (i + 1) % checkpoint_every == 0:
+            save_checkpoint(checkpoint, {
+                'mode': 'sequential',
+                'episode': i + 1,
+                'values': (p1.values, p2.values),
+                'epsilon': (p1.epsilon, p2.epsilon),
+                'random': random.getstate(),
+            })
     
     # Save the trained agent values
-    with open('trained_agent_values.pkl', 'wb') as f:
-        pickle.dump(p2.values, f)
+    save_trained_values(p2.values, base)
     
     print(f"Training complete! Agent has {len(p2.values)} learned states.")
     print(f"Final epsilon: {p2.epsilon:.3f}")
-    print("Saved to 'trained_agent_values.pkl'")
+    print("Saved to 'trained_agent_values.pkl' and 'trained_agent_values.bin'")
+
+def save_trained_values(values, base=None):
+    """Write the pickle and the memory-mappable binary the app prefers
+
+    With a base table, also write the entries that differ from it, which
+    is all a server already holding that table needs.
+    """
+    with open('trained_agent_values.pkl', 'wb') as f:
+        pickle.dump(values, f)
+    save_values(values, 'trained_agent_values.bin')
+    if base is not None:
+        count = save_delta(values, base, 'trained_agent_values.delta')
+        print(f"Wrote {count} changed states to 'trained_agent_values.delta'")
+
+def save_checkpoint(path, state):
+    """Pickle training state, replacing the old checkpoint only once the new one is complete"""
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        pickle.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+def load_checkpoint(path, mode):
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state['mode'] != mode:
+        raise SystemExit(f"{path} is a {state['mode']} checkpoint; resume it the same way")
+    # Symmetric tables unpickle over a dict; put them back on an array
+    state['values'] = tuple(CanonicalValues(ValueArray.from_dict(values.table))
+                            if isinstance(values, CanonicalValues) else values
+                            for values in state['values'])
+    return state
+
+def epsilon_at(episode):
+    """Exploration rate train_and_save_agent uses at a given episode"""
+    if episode <= 50000:
+        return 0.3
+    return max(0.1, 0.3 * 0.99 ** (episode - 50000))
+
+def winner_table():
+    """Winner (EMPTY while ongoing) of every reachable board, by base-3 index
+
+    Boards self-play cannot reach are left EMPTY; no game ever looks them up.
+    """
+    space = state_space()
+    winners = np.full(NUM_STATES, EMPTY, dtype=np.int8)
+    winners[np.frombuffer(space.index, dtype=np.uint16)] = np.frombuffer(space.winner, dtype=np.uint8)
+    return winners
+
+def move_table():
+    """9-bit mask of legal moves of every reachable board, by base-3 index"""
+    space = state_space()
+    moves = np.zeros(NUM_STATES, dtype=np.int64)
+    moves[np.frombuffer(space.index, dtype=np.uint16)] = np.frombuffer(space.moves, dtype=np.uint16)
+    return moves
+
+def winner_values(player, lossval):
+    """Agent.winnerval for every winner code, indexable by winner"""
+    values = np.empty(4)
+    values[player] = 1
+    values[EMPTY] = 0.5
+    values[DRAW] = 0
+    values[3 - player] = lossval
+    return values
+
+RANDOM_REPLY_STEP = 0.1  # Share of alpha for backups across an opponent's random move
+
+def backup_values(table, states, targets, random_reply, alpha):
+    """Move states toward the mean of their targets, as Agent.backup does
+
+    Errors are taken against the current value, not the score when the
+    state was chosen, so a state backed up on two turns of one batch does
+    not move twice by the same error. Targets reached through the
+    opponent's random move only take RANDOM_REPLY_STEP of the step: one
+    game corrects such a lucky result as soon as it plays the state again,
+    but a batch can only correct it in the next batch.
+    """
+    for damped, step in ((False, alpha), (True, alpha * RANDOM_REPLY_STEP)):
+        part = random_reply == damped
+        totals = np.bincount(states[part], weights=targets[part], minlength=NUM_STATES)
+        counts = np.bincount(states[part], minlength=NUM_STATES)
+        seen = counts > 0
+        table[seen] += step * (totals[seen] / counts[seen] - table[seen])
+
+def train_batched(episodes=100000, batch_size=512, alpha=0.99, lossval=-1, seed=None):
+    """Self-play many games in lockstep with NumPy, with Agent's TD rule
+    applied per batch (see backup_values)
+
+    Returns the value arrays for X and O, indexed by base-3 board index,
+    plus a mask of the boards O's greedy lookups touched.
+    """
+    if np is None:
+        raise SystemExit("Batched training needs NumPy: pip install numpy")
+
+    rng = np.random.default_rng(seed)
+    powers = 3 ** np.arange(9)
+    cells = np.arange(9)
+    winners = winner_table()
+    legal = move_table()
+
+    # Dense tables start at winnerval, i.e. what Agent.add would store
+    values = np.stack([
+        winner_values(PLAYER_X, lossval)[winners],
+        winner_values(PLAYER_O, lossval)[winners],
+    ])
+    touched = np.zeros(NUM_STATES, dtype=bool)
+    finals = np.stack([winner_values(PLAYER_X, lossval), winner_values(PLAYER_O, lossval)])
+
+    for start in range(0, episodes, batch_size):
+        if start % 10000 < batch_size:
+            print(f'Training game: {start}')
+        count = min(batch_size, episodes - start)
+        epsilon = np.array([epsilon_at(i) for i in range(start, start + count)])
+
+        boards = np.zeros(count, dtype=np.int64)
+        active = np.ones(count, dtype=bool)
+        prevstate = np.full((2, count), -1, dtype=np.int64)
+        explored = np.zeros(count, dtype=bool)  # Whether the last move was random
+
+        for turn in range(9):
+            mover = turn % 2
+            games = np.flatnonzero(active)
+            if len(games) == 0:
+                break
+            table = values[mover]
+
+            empty = (legal[boards[games], None] >> cells) & 1 == 1
+            candidates = np.where(empty, boards[games, None] + (mover + 1) * powers, 0)
+            scores = np.where(empty, table[candidates], -np.inf)
+            maxval = scores.max(axis=1)
+
+            # Random tie-breaking among the best moves, random cell when exploring
+            noise = rng.random(scores.shape)
+            greedy_move = np.where(scores == maxval[:, None], noise, -1).argmax(axis=1)
+            random_move = np.where(empty, noise, -1).argmax(axis=1)
+            explore = rng.random(len(games)) < epsilon[games]
+            move = np.where(explore, random_move, greedy_move)
+
+            # Greedy moves back up the best next value into the previous state
+            backup = ~explore & (prevstate[mover, games] >= 0)
+            backup_values(table, prevstate[mover, games[backup]], maxval[backup],
+                          explored[games[backup]], alpha)
+
+            chosen = candidates[np.arange(len(games)), move]
+            boards[games] = chosen
+            prevstate[mover, games] = chosen
+            if mover == 1:
+                # Boards O's lookups would have added to its dict
+                touched[candidates[~explore][empty[~explore]]] = True
+                touched[chosen] = True
+
+            # Finished games back up their final reward for both players
+            winner = winners[chosen]
+            done = winner != EMPTY
+            for player in range(2):
+                ended = done & (prevstate[player, games] >= 0)
+                backup_values(values[player], prevstate[player, games[ended]],
+                              finals[player][winners[boards[games[ended]]]],
+                              explore[ended] & (player != mover), alpha)
+            active[games[done]] = False
+            explored[games] = explore
+
+    return values[0], values[1], touched
+
+def train_and_save_batched(episodes=100000, batch_size=512, seed=None):
+    print(f"Training agents in batches of {batch_size} games...")
+
+    values_x, values_o, touched = train_batched(episodes, batch_size, seed=seed)
+
+    # Keep the states a sequential run would have stored: the ones Agent
+    # seeds at construction plus every state O looked up during play
+    seeded = Agent(PLAYER_O, lossval=-1).values
+    trained = {indexboard(int(index)): float(values_o[index]) for index in np.flatnonzero(touched)}
+    for state in seeded:
+        trained.setdefault(state, float(values_o[boardindex(state)]))
+
+    save_trained_values(trained)
+
+    print(f"Training complete! Agent has {len(trained)} learned states.")
+    print(f"Final epsilon: {epsilon_at(episodes - 1):.3f}")
+    print("Saved to 'trained_agent_values.pkl' and 'trained_agent_values.bin'")
+
+def train_shard(shard):
+    """Self-play one shard of episodes in a worker process"""
+    values_x, values_o, episodes, seed = shard
+    random.seed(seed)
+    # Passing the tables skips seeding; the agents then get private flat
+    # copies, which are faster in the hot loop than a shared layering
+    p1 = Agent(PLAYER_X, lossval=-1, values=values_x)
+    p2 = Agent(PLAYER_O, lossval=-1, values=values_o)
+    p1.values = dict(values_x)
+    p2.values = dict(values_o)
+
+    started = time.perf_counter()
+    for i in episodes:
+        p1.epsilon = p2.epsilon = epsilon_at(i)
+        winner = play(p1, p2)
+        p1.episode_over(winner)
+        p2.episode_over(winner)
+    elapsed = time.perf_counter() - started
+
+    # Only the entries this shard changed travel back to the parent
+    changed_x = {key: value for key, value in p1.values.items() if values_x.get(key) != value}
+    changed_o = {key: value for key, value in p2.values.items() if values_o.get(key) != value}
+    return changed_x, changed_o, elapsed
+
+def merge_values(base, updates):
+    """Average each changed state over all shards
+
+    A shard that left a state alone contributes the base value, so a
+    state one shard moved by delta moves by delta / len(updates).
+    """
+    merged = dict(base)
+    for key in set().union(*updates):
+        values = [update[key] if key in update else base[key]
+                  for update in updates if key in update or key in base]
+        merged[key] = sum(values) / len(values)
+    return merged
+
+def train_parallel(episodes=100000, workers=4, sync_every=1000, seed=None,
+                   checkpoint=None, resume=False, init_values=None):
+    """Self-play in a process pool, merging value tables at each barrier
+
+    With checkpoint, the tables and the seed generator are saved at every
+    barrier; workers reseed from it, so a resumed run plays the same
+    games as one that was never interrupted.
+    """
+    rng = random.Random(seed)
+    values_x = Agent(PLAYER_X, lossval=-1).values
+    values_o = Agent(PLAYER_O, lossval=-1).values
+    first = 0
+    if resume:
+        state = load_checkpoint(checkpoint, 'parallel')
+        values_x, values_o = state['values']
+        rng.setstate(state['random'])
+        first = state['episode']
+        print(f"Resuming from episode {first}")
+    elif init_values:
+        values_o = read_values(init_values)
+        if isinstance(values_o, CanonicalValues):
+            values_o = values_o.expand()  # Shards merge plain dicts
+    busy = [0.0] * workers
+    played = [0] * workers
+
+    started = time.perf_counter()
+    with Pool(workers) as pool:
+        for start in range(first, episodes, workers * sync_every):
+            stop = min(start + workers * sync_every, episodes)
+            # Interleave episode numbers so every shard follows the epsilon schedule
+            shards = [(values_x, values_o, range(start + w, stop, workers), rng.randrange(2 ** 32))
+                      for w in range(workers)]
+            results = pool.map(train_shard, shards)
+
+            values_x = merge_values(values_x, [result[0] for result in results])
+            values_o = merge_values(values_o, [result[1] for result in results])
+            for w, result in enumerate(results):
+                busy[w] += result[2]
+                played[w] += len(shards[w][2])
+
+            elapsed = time.perf_counter() - started
+            print(f'Training game: {stop} ({(stop - first) / elapsed:.0f} episodes/sec)')
+            if checkpoint:
+                save_checkpoint(checkpoint, {
+                    'mode': 'parallel',
+                    'episode': stop,
+                    'values': (values_x, values_o),
+                    'random': rng.getstate(),
+                })
+
+    elapsed = time.perf_counter() - started
+    for w in range(workers):
+        if played[w]:
+            print(f"Worker {w}: {played[w]} episodes, {played[w] / busy[w]:.0f} episodes/sec")
+    total = max(0, episodes - first)
+    print(f"Aggregate: {total} episodes in {elapsed:.1f}s, {total / elapsed:.0f} episodes/sec")
+    return values_x, values_o
+
+def train_and_save_parallel(episodes=100000, workers=4, sync_every=1000, seed=None,
+                            checkpoint=None, resume=False, init_values=None, delta_base=None):
+    print(f"Training agents on {workers} workers, merging every {sync_every} episodes per worker...")
+    # The base may be the very file this run overwrites, so read it first
+    base = read_values(delta_base) if delta_base else None
+
+    values_x, values_o = train_parallel(episodes, workers, sync_every, seed, checkpoint, resume, init_values)
+
+    save_trained_values(values_o, base)
+
+    print(f"Training complete! Agent has {len(values_o)} learned states.")
+    print(f"Final epsilon: {epsilon_at(episodes - 1):.3f}")
+    print("Saved to 'trained_agent_values.pkl' and 'trained_agent_values.bin'")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Train a tic-tac-toe AI agent')
     parser.add_argument('--episodes', type=int, default=100000,
                         help='Number of training episodes (default: 100000)')
+    parser.add_argument('--batched', action='store_true',
+                        help='Play games in lockstep with NumPy (much faster)')
+    parser.add_argument('--batch-size', type=int, default=512,
+                        help='Games per batch with --batched (default: 512)')
+    parser.add_argument('--symmetric', action='store_true',
+                        help='Store one value per symmetry class (sequential training only)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Self-play worker processes (default: 1)')
+    parser.add_argument('--sync-every', type=int, default=1000,
+                        help='Episodes per worker between value merges (default: 1000)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed, for reproducible runs')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='Save values, epsilon and random state here while training')
+    parser.add_argument('--checkpoint-every', type=int, default=10000,
+                        help='Episodes between sequential checkpoints; parallel runs save at every merge (default: 10000)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the run saved in --checkpoint up to --episodes')
+    parser.add_argument('--init-values', metavar='PATH',
+                        help="Start O from an existing value table (.pkl or .bin) instead of from scratch")
+    parser.add_argument('--delta-base', metavar='PATH',
+                        help="Also write the entries that differ from this table to 'trained_agent_values.delta'")
 
     args = parser.parse_args()
-    train_and_save_agent(args.episodes)
\ No newline at end of file
+    if args.batched and args.workers > 1:
+        parser.error('--batched and --workers cannot be combined')
+    if args.symmetric and (args.batched or args.workers > 1):
+        parser.error('--symmetric only applies to sequential training')
+    if args.batched and (args.checkpoint or args.init_values or args.delta_base):
+        parser.error('--checkpoint, --init-values and --delta-base do not apply to --batched')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs --checkpoint')
+    if args.resume and not os.path.exists(args.checkpoint):
+        parser.error(f'no checkpoint at {args.checkpoint}')
+    if args.resume and (args.init_values or args.symmetric):
+        parser.error('--init-values and --symmetric come from the checkpoint when resuming')
+    if args.batched:
+        train_and_save_batched(args.episodes, args.batch_size, args.seed)
+    elif args.workers > 1:
+        train_and_save_parallel(args.episodes, args.workers, args.sync_every, args.seed,
+                                args.checkpoint, args.resume, args.init_values, args.delta_base)
+    else:
+        train_and_save_agent(args.episodes, args.symmetric, args.seed, args.checkpoint,
+                             args.checkpoint_every, args.resume, args.init_values, args.delta_base)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from metrics import TREE_BUILD
+from value_table import boardindex
+
+DEFAULT_WORKERS = 2
+MAX_CACHED = 256   # Tree levels kept, finished or in progress
+JOB_TTL = 600      # Seconds a job id stays valid
+HEARTBEAT = 15     # Seconds between keep-alive comments on an event stream
+
+JOB_BUILD = TREE_BUILD.labels('job')
+
+
+def build_records(board, player, depth):
+    """(compact tree records, seconds taken) for one board, run inside a worker process"""
+    from game_engine import TicTacToeGame
+    from game_tree import GameTree
+    start = time.perf_counter()
+    records = list(GameTree(TicTacToeGame()).compact_nodes(board, player, depth))
+    return records, time.perf_counter() - start
+
+def observe_build(future):
+    # Worker processes keep their own metrics; report the build time here
+    if not future.cancelled() and future.exception() is None:
+        JOB_BUILD.observe(future.result()[1])
+
+
+class TreeJobs:
+    """Game trees built in a process pool, so request threads never do it
+
+    A job asks for every depth from 1 up to the one requested, so
+    shallow levels can be shown while deeper ones are still being built.
+    Each level is a future cached by (board, player, depth): every game
+    reads the same trained table, so any game can reuse any board's
+    levels, and a level already in progress is shared rather than
+    rebuilt.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.environ.get('TREE_WORKERS', DEFAULT_WORKERS))
+        self.executor = None
+        self.cache = OrderedDict()  # (board index, player, depth) -> Future
+        self.jobs = {}              # job id -> (created, player, [(depth, Future)])
+        self.lock = threading.Lock()
+
+    def level(self, board, player, depth):
+        key = (boardindex(board), player, depth)
+        future = self.cache.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.workers)
+            future = self.executor.submit(build_records, board, player, depth)
+            future.add_done_callback(observe_build)
+            self.cache[key] = future
+            while len(self.cache) > MAX_CACHED:
+                self.cache.popitem(last=False)
+        self.cache.move_to_end(key)
+        return future
+
+    def submit(self, board, player, depth):
+        """Start (or reuse) the levels of a tree; returns the job id"""
+        job_id = secrets.token_hex(8)
+        now = time.monotonic()
+        with self.lock:
+            for old in [old for old, job in self.jobs.items() if now - job[0] > JOB_TTL]:
+                del self.jobs[old]
+            levels = [(d, self.level(board, player, d)) for d in range(1, depth + 1)]
+            self.jobs[job_id] = (now, player, levels)
+        return job_id
+
+    def job(self, job_id):
+        """(player, levels) of a job, or None if it is unknown or expired"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return None if job is None else job[1:]
+
+    def payload(self, player, depth, nodes):
+        return {'depth': depth, 'format': 'compact', 'player': player, 'start_depth': 0, 'nodes': nodes}
+
+    def status(self, job_id):
+        """Progress of a job with the deepest finished level, or None if unknown"""
+        job = self.job(job_id)
+        if job is None:
+            return None
+        player, levels = job
+        finished = [(depth, future) for depth, future in levels if future.done()]
+        failed = [future for _, future in finished if future.exception() is not None]
+        if failed:
+            return {'job_id': job_id, 'status': 'error', 'error': str(failed[0].exception())}
+        result = {
+            'job_id': job_id,
+            'status': 'done' if len(finished) == len(levels) else 'pending',
+            'depth': levels[-1][0],
+            'levels_done': len(finished),
+        }
+        if finished:
+            depth, future = max(finished, key=lambda level: level[0])
+            result['result'] = self.payload(player, depth, future.result()[0])
+        return result
+
+    def events(self, job_id):
+        """Server-sent events: one 'level' per depth as it finishes, then 'done'"""
+        player, levels = self.job(job_id) or (None, [])
+        for depth, future in levels:
+            while True:
+                done, _ = wait([future], timeout=HEARTBEAT)
+                if done:
+                    break
+                yield ': waiting\n\n'
+            try:
+                nodes = future.result()[0]
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                return
+            data = json.dumps(self.payload(player, depth, nodes), separators=(',', ':'))
+            yield f"event: level\ndata: {data}\n\n"
+        yield f"event: done\ndata: {json.dumps({'job_id': job_id})}\n\n"
@@ -1,12 +1,10 @@
-import pickle
-import sys
-sys.path.append('.')
-from og import Agent, PLAYER_O, PLAYER_X, play
+from game_engine import Agent, PLAYER_O, PLAYER_X, play
+from train_agent import save_trained_values
 
 def train_with_original_method():
-    print("Training using original og.py method...")
+    print("Training using the original method (fixed epsilon, 50000 games)...")
     
-    # Use the exact same training as og.py
+    # Plain self-play with the Agent defaults, as the original og.py did
     p1 = Agent(PLAYER_X, lossval=-1)
     p2 = Agent(PLAYER_O, lossval=-1)
     
@@ -19,9 +17,8 @@ def train_with_original_method():
         p1.episode_over(winner)
         p2.episode_over(winner)
     
-    # Save the trained P2 (PLAYER_O) agent values
-    with open('trained_agent_values.pkl', 'wb') as f:
-        pickle.dump(p2.values, f)
+    # Save the trained P2 (PLAYER_O) agent values, pickle and binary
+    save_trained_values(p2.values)
     
     print(f"Training complete! Agent has {len(p2.values)} learned states.")
     
@@ -0,0 +1,94 @@
+from array import array
+from collections.abc import MutableMapping
+
+NUM_STATES = 3 ** 9  # Every assignment of EMPTY/X/O to the 9 cells
+MISSING = float('nan')  # Marks boards that have no value yet
+
+
+def boardindex(board):
+    """Base-3 index of a 3x3 board, cell (i, j) being digit 3*i + j"""
+    (a, b, c), (d, e, f), (g, h, i) = board
+    return a + 3*b + 9*c + 27*d + 81*e + 243*f + 729*g + 2187*h + 6561*i
+
+def indexboard(index):
+    """Board tuple, in Agent.statetuple form, for a base-3 index"""
+    cells = []
+    for _ in range(9):
+        index, cell = divmod(index, 3)
+        cells.append(cell)
+    return (tuple(cells[0:3]), tuple(cells[3:6]), tuple(cells[6:9]))
+
+
+class ValueArray(MutableMapping):
+    """Value table stored as one float per board, indexed by boardindex
+
+    Keys may be base-3 indices or boards (lists or statetuple tuples), so
+    the table can stand in for the dict an Agent normally uses. Iteration
+    yields statetuple keys, which keeps dict(table) pickle-compatible.
+    A table over a read-only buffer copies it on the first write.
+
+    cache holds results derived from the values (see
+    game_engine.analyze_position). Views share it with their source, and
+    any write leaves the table with an empty cache.
+    """
+
+    def __init__(self, data=None, cache=None):
+        if data is None:
+            data = array('d', [MISSING]) * NUM_STATES
+        self.data = data
+        self.cache = {} if cache is None else cache
+
+    @classmethod
+    def from_dict(cls, values):
+        table = cls()
+        for key, value in values.items():
+            table[key] = value
+        return table
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def view(self):
+        """Read-only table over the same buffer, copied on first write"""
+        return ValueArray(memoryview(self.data).toreadonly(), self.cache)
+
+    def copy(self):
+        data = array('d')
+        data.frombytes(memoryview(self.data).tobytes())
+        return ValueArray(data)
+
+    def _index(self, key):
+        if isinstance(key, int):
+            return key
+        return boardindex(key)
+
+    def __contains__(self, key):
+        value = self.data[self._index(key)]
+        return value == value
+
+    def __getitem__(self, key):
+        value = self.data[self._index(key)]
+        if value != value:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if not isinstance(self.data, array):
+            self.data = self.copy().data
+            self.cache = {}
+        elif self.cache:
+            self.cache.clear()
+        self.data[self._index(key)] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = MISSING
+
+    def __iter__(self):
+        for index, value in enumerate(self.data):
+            if value == value:
+                yield indexboard(index)
+
+    def __len__(self):
+        return sum(1 for value in self.data if value == value)
@@ -0,0 +1,197 @@
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+from array import array
+from symmetry import CanonicalValues
+from value_table import NUM_STATES, ValueArray
+
+MAGIC = b'TTTV'
+DELTA_MAGIC = b'TTTD'
+VERSION = 1
+HEADER_SIZE = 16  # Magic, version, flags, entry count; keeps the floats 8-byte aligned
+CANONICAL = 1     # Flag: entries are stored once per symmetry class
+
+
+def _dense(values):
+    """(flags, little-endian float64 array with one entry per board index)"""
+    flags = 0
+    if isinstance(values, CanonicalValues):
+        flags |= CANONICAL
+        values = values.table
+    if not isinstance(values, ValueArray):
+        values = ValueArray.from_dict(values)
+
+    data = array('d')
+    data.frombytes(memoryview(values.data).tobytes())
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return flags, data
+
+def table_digest(values):
+    """SHA-256 of a table's dense form, identifying the base a delta applies to"""
+    flags, data = _dense(values)
+    return hashlib.sha256(bytes([flags]) + data.tobytes()).digest()
+
+def save_values(values, path):
+    """Write a value table as a header plus a dense float64 array
+
+    values may be a dict keyed by statetuple, a ValueArray, or a
+    CanonicalValues table. Boards without a value are stored as NaN;
+    symmetric tables keep the full size too, with values only at the
+    canonical indices, so they can be memory-mapped the same way.
+    """
+    flags, data = _dense(values)
+    # Running apps memory-map the file: truncating it in place would
+    # crash them, so the new file replaces the old one in a single step
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(MAGIC)
+        for field in (VERSION, flags, NUM_STATES):
+            f.write(field.to_bytes(4, 'little'))
+        data.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+def load_values(path):
+    """Memory-map a value file; every process shares the same pages
+
+    Returns a read-only ValueArray (wrapped in CanonicalValues for
+    symmetric files). Agents copy it on their first write.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:4] != MAGIC:
+            raise ValueError(f"{path} is not a value file")
+        version, flags, count = (int.from_bytes(header[k:k + 4], 'little') for k in (4, 8, 12))
+        if version != VERSION or count != NUM_STATES:
+            raise ValueError(f"{path} has version {version} with {count} entries; "
+                             f"expected version {VERSION} with {NUM_STATES}")
+        if sys.byteorder == 'little':
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = memoryview(mapped)[HEADER_SIZE:].cast('d')
+        else:
+            data = array('d')
+            data.fromfile(f, NUM_STATES)
+            data.byteswap()
+            data = memoryview(data).toreadonly()
+
+    table = ValueArray(data)
+    if flags & CANONICAL:
+        return CanonicalValues(table)
+    return table
+
+def read_values(path):
+    """Writable table from a .bin or pickle file, in the form training uses
+
+    Plain tables come back as dicts keyed by statetuple; symmetric ones
+    as CanonicalValues over a private array.
+    """
+    if path.endswith('.bin'):
+        values = load_values(path)
+    else:
+        with open(path, 'rb') as f:
+            values = pickle.load(f)
+    if isinstance(values, CanonicalValues):
+        return CanonicalValues(ValueArray.from_dict(values.table))
+    return dict(values.items())
+
+
+def save_delta(values, base, path):
+    """Write only the entries of values that differ from base
+
+    The file holds the base table's digest, so it can only be applied to
+    the table it was made from. Entries removed from base are stored as
+    NaN, like missing boards in a value file.
+    """
+    flags, new = _dense(values)
+    base_flags, old = _dense(base)
+    if flags != base_flags:
+        raise ValueError("Cannot diff a symmetric table against a full one")
+    indices = array('I', (index for index, (a, b) in enumerate(zip(new, old))
+                          if not (a == b or (a != a and b != b))))
+    changes = array('d', (new[index] for index in indices))
+    if sys.byteorder != 'little':
+        indices.byteswap()
+    with open(path, 'wb') as f:
+        f.write(DELTA_MAGIC)
+        for field in (VERSION, flags, len(indices)):
+            f.write(field.to_bytes(4, 'little'))
+        f.write(table_digest(base))
+        indices.tofile(f)
+        changes.tofile(f)
+    return len(indices)
+
+def apply_delta(base, path):
+    """New table: base with a delta file's entries written over it"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:4] != DELTA_MAGIC:
+            raise ValueError(f"{path} is not a delta file")
+        version, flags, count = (int.from_bytes(header[k:k + 4], 'little') for k in (4, 8, 12))
+        if version != VERSION:
+            raise ValueError(f"{path} has version {version}; expected {VERSION}")
+        if f.read(32) != table_digest(base):
+            raise ValueError(f"{path} was made from a different base table")
+        indices = array('I')
+        indices.fromfile(f, count)
+        changes = array('d')
+        changes.fromfile(f, count)
+    if sys.byteorder != 'little':
+        indices.byteswap()
+        changes.byteswap()
+
+    table = base.table if isinstance(base, CanonicalValues) else base
+    if isinstance(table, ValueArray):
+        table = table.copy()
+    else:
+        table = ValueArray.from_dict(table)
+    for index, value in zip(indices, changes):
+        table.data[index] = value
+    if flags & CANONICAL:
+        return CanonicalValues(table)
+    return table
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert, diff and patch value table files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('to-binary', 'to-pickle'):
+        command = commands.add_parser(name, help=f'Convert a value table {name.replace("-", " ")} format')
+        command.add_argument('source')
+        command.add_argument('target')
+    command = commands.add_parser('diff', help='Write the entries of NEW that differ from BASE')
+    command.add_argument('base')
+    command.add_argument('new')
+    command.add_argument('delta')
+    command = commands.add_parser('apply', help='Apply a delta file to BASE and write the result')
+    command.add_argument('base')
+    command.add_argument('delta')
+    command.add_argument('target')
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        count = save_delta(read_values(args.new), read_values(args.base), args.delta)
+        print(f"Wrote {count} changed states to '{args.delta}'")
+        sys.exit()
+
+    if args.command == 'to-binary':
+        with open(args.source, 'rb') as f:
+            values = pickle.load(f)
+    elif args.command == 'to-pickle':
+        values = read_values(args.source)
+    else:
+        values = apply_delta(read_values(args.base), args.delta)
+        if not isinstance(values, CanonicalValues):
+            values = values.to_dict()
+
+    if args.target.endswith('.bin'):
+        save_values(values, args.target)
+    else:
+        with open(args.target, 'wb') as f:
+            pickle.dump(values, f)
+    print(f"Wrote {len(values)} states to '{args.target}'")